@@ -2,424 +2,4417 @@
 # coding=utf-8
 
 import argparse
+import ast
+import atexit
 import datetime
+import email.utils
+import fnmatch
+import io
+import itertools
 import json
 import logging
+import marshal
+import math
 import os
+import queue
+import re
+import sqlite3
+import subprocess
 import sys
+import tempfile
+import threading
 import time
+import zlib
 import csv
+from array import array
+from collections import deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from logging.handlers import QueueHandler, QueueListener
+from urllib.parse import quote, urlencode, urlparse
 
-from github import Github, GithubException
-from tabulate import tabulate
+# requests, PyGithub, tabulate and asyncio are imported where they are used,
+# so importing gitminer as a library stays cheap
 from termcolor import colored
 
-file = open("config.json", "r")
-data = json.load(file)
-file.close()
-ACME_GITHUB_HOSTNAME = data["ACME_GITHUB_HOSTNAME"]
-ACME_GITHUB_TOKEN = data["ACME_GITHUB_TOKEN"]
+if not sys.stdout.isatty():
+    # No ANSI escapes when the output is piped or redirected to a file
+    def colored(text, *args, **kwargs):
+        return text
+
+
 WORKING_DIR = os.path.abspath(os.path.dirname(__file__))
 LOG_DIR = WORKING_DIR + "/logs/"
 BEGIN = time.time()
+# Seconds between fsyncs of the streamed CSV/JSONL outputs
+SYNC_INTERVAL = 5
+# Rows per row group of the --parquet output
+PARQUET_ROW_GROUP = 10000
+# Repos per transaction of the --db inventory
+DB_BATCH = 500
+# Buckets per doubling of the repo size histograms, bounding median errors to ~9%
+SIZE_BUCKETS_PER_DOUBLING = 4
+SIZE_BUCKETS = 48 * SIZE_BUCKETS_PER_DOUBLING
+# Below this share of its rate limit a token's requests get spread until reset
+RATE_LIMIT_PACING = 0.1
+# Times a request is retried after hitting a rate limit before giving up
+RATE_LIMIT_RETRIES = 5
+# Repos per GraphQL page, 100 is the most the API allows
+GRAPHQL_PAGE_SIZE = 50
+# Repos per work unit of --all, a Future per repo would weigh more than the repo
+REPO_BATCH = 16
+# Work units of --all in flight per worker, enough that a slow one doesn't
+# leave the others idle, few enough that results don't pile up
+UNITS_PER_WORKER = 4
+# Bytes of snapshot joined in memory by --diff, larger snapshots are first hash
+# partitioned by org/repo into temp files of about this size
+DIFF_PARTITION_BYTES = 64 * 1024 * 1024
+# Rows written at a time to the temp partitions of --diff
+DIFF_CHUNK = 1024
+# Root files listed in the churn table of --diff
+DIFF_TOP_FILES = 20
+GRAPHQL_REPOS_QUERY = """
+query($org: String!, $pageSize: Int!, $cursor: String) {
+  organization(login: $org) {
+    login
+    email
+    url
+    repositories(first: $pageSize, after: $cursor) {
+      pageInfo {
+        hasNextPage
+        endCursor
+      }
+      nodes {
+        name
+        diskUsage
+        isFork
+        isArchived
+        pushedAt
+        primaryLanguage {
+          name
+        }
+        languages(first: 100, orderBy: {field: SIZE, direction: DESC}) {
+          edges {
+            size
+            node {
+              name
+            }
+          }
+        }
+        object(expression: "HEAD:") {
+          ... on Tree {
+            entries {
+              name
+            }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+# Languages of --source mirrors files by extension or file name, standing in for
+# the linguist detection behind the API's repo languages
+MIRROR_LANGUAGES = {
+    ".c": "C",
+    ".h": "C",
+    ".cc": "C++",
+    ".cpp": "C++",
+    ".cxx": "C++",
+    ".hpp": "C++",
+    ".cs": "C#",
+    ".clj": "Clojure",
+    ".coffee": "CoffeeScript",
+    ".css": "CSS",
+    ".dart": "Dart",
+    ".ex": "Elixir",
+    ".exs": "Elixir",
+    ".erl": "Erlang",
+    ".fs": "F#",
+    ".go": "Go",
+    ".gradle": "Gradle",
+    ".groovy": "Groovy",
+    ".hs": "Haskell",
+    ".hcl": "HCL",
+    ".tf": "HCL",
+    ".html": "HTML",
+    ".htm": "HTML",
+    ".java": "Java",
+    ".js": "JavaScript",
+    ".jsx": "JavaScript",
+    ".mjs": "JavaScript",
+    ".ipynb": "Jupyter Notebook",
+    ".kt": "Kotlin",
+    ".kts": "Kotlin",
+    ".less": "Less",
+    ".lua": "Lua",
+    ".m": "Objective-C",
+    ".mm": "Objective-C++",
+    ".php": "PHP",
+    ".pl": "Perl",
+    ".pm": "Perl",
+    ".ps1": "PowerShell",
+    ".py": "Python",
+    ".r": "R",
+    ".rb": "Ruby",
+    ".rs": "Rust",
+    ".scala": "Scala",
+    ".scss": "SCSS",
+    ".sh": "Shell",
+    ".bash": "Shell",
+    ".zsh": "Shell",
+    ".sql": "PLpgSQL",
+    ".swift": "Swift",
+    ".ts": "TypeScript",
+    ".tsx": "TypeScript",
+    ".vue": "Vue",
+    "Dockerfile": "Dockerfile",
+    "Makefile": "Makefile",
+    "CMakeLists.txt": "CMake",
+    ".cmake": "CMake",
+    "Rakefile": "Ruby",
+    "Jenkinsfile": "Groovy",
+}
+# Directories that don't count towards a mirror's languages, like linguist's
+# vendored paths
+MIRROR_VENDORED = ("node_modules/", "vendor/", "third_party/")
 BANNER = """
 **************************************************
                GITMINER:
 A tool to mine useful data from Github Enterprise
 **************************************************
 """
-# Creates logs dir if it doesn't exist
-if not os.path.isdir(LOG_DIR):
+# Logs to the "gitminer" logger, which has no handlers of its own: the CLI
+# attaches them in setup_logging, a library caller decides where records go
+log = logging.getLogger("gitminer")
+log.addHandler(logging.NullHandler())
+
+tstamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+log_listener = None
+
+
+class DeferredQueueHandler(QueueHandler):
+    # Hands records over as they are: messages are formatted by the listener
+    def prepare(self, record):
+        return record
+
+
+def load_config(config_file="config.json"):
+    """
+    Reads the hostnames and tokens of config.json
+
+    Args:
+        config_file (String, optional): Path of the config. Defaults to "config.json".
+
+    Returns:
+        (dict): ACME_GITHUB_HOSTNAME, ACME_GITHUB_TOKEN and the optional pool of
+        extra tokens to rotate across, ACME_GITHUB_TOKENS
+    """
+    with open(config_file, "r") as file:
+        data = json.load(file)
+    data.setdefault("ACME_GITHUB_TOKENS", [])
+    return data
+
+
+def setup_logging():
+    """
+    Logs to the terminal and to logs/git_miner_<timestamp>.log. The handlers
+    run on a listener thread fed by a queue, so formatting and writing the log
+    never holds up the crawl.
+    """
+    global log_listener
+    # Creates logs dir if it doesn't exist
+    if not os.path.isdir(LOG_DIR):
+        try:
+            os.mkdir(LOG_DIR)
+        except Exception as e:
+            print(f"[*] Could not create logs/ dir because of: {e}, exiting ...")
+            sys.exit()
+
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    output_file_handler = logging.FileHandler(
+        "{}git_miner_{}.log".format(LOG_DIR, tstamp)
+    )
+    stdout_handler = logging.StreamHandler(sys.stdout)
+    log_queue = queue.SimpleQueue()
+    log_listener = QueueListener(log_queue, output_file_handler, stdout_handler)
+    root.addHandler(DeferredQueueHandler(log_queue))
+    log_listener.start()
+    atexit.register(log_listener.stop)
+
+
+def flush_log():
+    """
+    Waits until the log listener wrote out every queued record, before
+    writing to the terminal directly (prompts, help)
+    """
+    if log_listener:
+        log_listener.stop()
+        log_listener.start()
+
+
+def shard_spec(value):
+    """
+    Parses a --shard value
+
+    Args:
+        value (String): Shard number and shard count, as "i/N"
+
+    Returns:
+        (Tuple): Shard number from 1 to N and N
+    """
     try:
-        os.mkdir(LOG_DIR)
-    except Exception as e:
-        print(f"[*] Could not create logs/ dir because of: {e}, exiting ...")
-        sys.exit()
+        index, count = (int(x) for x in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected i/N, got {value}")
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"shard {index} is not within 1/{count}")
+    return index, count
+
+
+def date_spec(value):
+    """
+    Parses a --pushed-since value
+
+    Args:
+        value (String): Date as YYYY-MM-DD, or UTC time as YYYY-MM-DDTHH:MM:SSZ
+
+    Returns:
+        (datetime): Naive UTC datetime, like the timestamps of PyGithub
+    """
+    for date_format in ("%Y-%m-%d", "%Y-%m-%dT%H:%M:%SZ"):
+        try:
+            return datetime.datetime.strptime(value, date_format)
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError(f"expected YYYY-MM-DD, got {value}")
+
+
+def build_parser():
+    """
+    Builds the command line parser of the CLI
+
+    Returns:
+        (ArgumentParser): Parser of the gitminer.py flags
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--hostname",
+        dest="hostname",
+        help="Hostname URL: acme",
+        action="store",
+        required=False,
+    )
+    parser.add_argument(
+        "--org",
+        dest="org_name",
+        help="Organization Name(ex: Security)",
+        action="store",
+        required=False,
+    )
+    parser.add_argument(
+        "--repo",
+        dest="repo_name",
+        help="Repository Name(ex: GitMiner)",
+        action="store",
+        required=False,
+    )
+    parser.add_argument(
+        "-a",
+        "--all",
+        dest="all_orgs",
+        help="To run in all orgs and repos, set this flag.",
+        action="store_true",
+        default=False,
+        required=False,
+    )
+    parser.add_argument(
+        "-n",
+        "--noprompt",
+        dest="noprompt",
+        help="Do not prompt.",
+        action="store_true",
+        default=False,
+        required=False,
+    )
+    parser.add_argument(
+        "-c",
+        "--csv",
+        dest="csv_file",
+        help="write CSV data to file",
+        action="store",
+        required=False,
+    )
+    parser.add_argument(
+        "-j",
+        "--json",
+        dest="json_file",
+        help="write jsonL data to file",
+        action="store",
+        required=False,
+    )
+    parser.add_argument(
+        "--parquet",
+        dest="parquet_file",
+        help="write Parquet data to file, with the byte size of every language (needs pyarrow)",
+        action="store",
+        required=False,
+    )
+    parser.add_argument(
+        "--db",
+        dest="db_file",
+        help="write data to a SQLite inventory kept across runs, ex: inventory.sqlite",
+        action="store",
+        required=False,
+    )
+    parser.add_argument(
+        "--runs",
+        dest="list_runs",
+        help="List the runs stored in the --db inventory",
+        action="store_true",
+        default=False,
+        required=False,
+    )
+    parser.add_argument(
+        "--run",
+        dest="run_id",
+        help="Print the language table of a run stored in the --db inventory, or of the last one",
+        action="store",
+        nargs="?",
+        const="last",
+        required=False,
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        dest="workers",
+        help="Number of repos to fetch concurrently (default: 1)",
+        action="store",
+        type=int,
+        default=1,
+        required=False,
+    )
+    parser.add_argument(
+        "--source",
+        dest="source",
+        help="Where repos are mined from: api (default), or mirrors:<dir> to read local bare mirrors laid out as <dir>/<org>/<repo>.git without any request",
+        action="store",
+        type=source_spec,
+        default=("api", None),
+        required=False,
+    )
+    parser.add_argument(
+        "--skip-forks",
+        dest="skip_forks",
+        help="Do not mine forks of other repos",
+        action="store_true",
+        default=False,
+        required=False,
+    )
+    parser.add_argument(
+        "--skip-archived",
+        dest="skip_archived",
+        help="Do not mine archived repos",
+        action="store_true",
+        default=False,
+        required=False,
+    )
+    parser.add_argument(
+        "--pushed-since",
+        dest="pushed_since",
+        help="Only mine repos pushed since this date, ex: 2024-01-31",
+        action="store",
+        type=date_spec,
+        required=False,
+    )
+    parser.add_argument(
+        "--full-tree",
+        dest="full_tree",
+        help="Also list the files of each repo's whole default branch tree in a repo_tree column",
+        action="store_true",
+        default=False,
+        required=False,
+    )
+    parser.add_argument(
+        "--tree-depth",
+        dest="tree_depth",
+        help="Like --full-tree, for files up to this depth only, 1 being the root",
+        action="store",
+        type=int,
+        required=False,
+    )
+    parser.add_argument(
+        "--tree-glob",
+        dest="tree_globs",
+        help="Only keep tree files matching one of these globs, matched against the file name if they have no /, ex: Dockerfile pom.xml '.github/workflows/*' (implies --full-tree)",
+        action="store",
+        nargs="+",
+        metavar="GLOB",
+        required=False,
+    )
+    parser.add_argument(
+        "--engine",
+        dest="engine",
+        help="Engine used to mine: rest (default), graphql, which fetches a page of repos with their languages and root files per request, or async, an asyncio REST client (needs aiohttp)",
+        action="store",
+        choices=["rest", "graphql", "async"],
+        default="rest",
+        required=False,
+    )
+    parser.add_argument(
+        "--cache-dir",
+        dest="cache_dir",
+        help="Directory of the on-disk HTTP response cache (default: logs/cache/)",
+        action="store",
+        required=False,
+    )
+    parser.add_argument(
+        "--cache-size",
+        dest="cache_size",
+        help="Size cap of the HTTP response cache in MB (default: 512)",
+        action="store",
+        type=int,
+        default=512,
+        required=False,
+    )
+    parser.add_argument(
+        "--no-cache",
+        dest="no_cache",
+        help="Do not use the HTTP response cache.",
+        action="store_true",
+        default=False,
+        required=False,
+    )
+    parser.add_argument(
+        "--incremental",
+        dest="state_file",
+        help="Only re-mine repos pushed since the last run, reusing the rows kept in a state file (default: logs/incremental_state.json)",
+        action="store",
+        nargs="?",
+        const=LOG_DIR + "incremental_state.json",
+        required=False,
+    )
+    parser.add_argument(
+        "--resume",
+        dest="resume_file",
+        help="Resume an interrupted --all crawl from its checkpoint file",
+        action="store",
+        required=False,
+    )
+    parser.add_argument(
+        "--concurrency",
+        dest="concurrency",
+        help="Requests in flight with --engine async (default: 64)",
+        action="store",
+        type=int,
+        default=64,
+        required=False,
+    )
+    parser.add_argument(
+        "--profile",
+        dest="profile",
+        help="Count requests, latency and bytes per phase and write a JSON report to logs/",
+        action="store_true",
+        default=False,
+        required=False,
+    )
+    parser.add_argument(
+        "--log-format",
+        dest="log_format",
+        help="Output of mined orgs and repos: tree (default), jsonl with one event per repo, or quiet for the summary only",
+        action="store",
+        choices=["tree", "jsonl", "quiet"],
+        default="tree",
+        required=False,
+    )
+    parser.add_argument(
+        "--language-view",
+        dest="language_views",
+        help="Language tables printed at the end: core counts repos by core language (default), bytes totals the bytes of every language, orgs shows the languages of each org",
+        action="store",
+        nargs="+",
+        choices=["core", "bytes", "orgs"],
+        default=["core"],
+        required=False,
+    )
+    parser.add_argument(
+        "--shard",
+        dest="shard",
+        help="Only mine shard i of N of the orgs with --all, ex: 2/4",
+        action="store",
+        type=shard_spec,
+        required=False,
+    )
+    parser.add_argument(
+        "--shard-by",
+        dest="shard_by",
+        help="How --shard partitions orgs: hash of the org login (default) or size, balancing repo counts",
+        action="store",
+        choices=["hash", "size"],
+        default="hash",
+        required=False,
+    )
+    parser.add_argument(
+        "--merge",
+        dest="merge_files",
+        help="Merge the CSV/JSONL outputs and checkpoints of --shard runs into -c/-j and print their language table",
+        action="store",
+        nargs="+",
+        metavar="SHARD_FILE",
+        required=False,
+    )
+    parser.add_argument(
+        "--diff",
+        dest="diff_files",
+        help="Compare two CSV/JSONL outputs: new, deleted and changed repos, root file churn and language deltas",
+        action="store",
+        nargs=2,
+        metavar=("OLD_FILE", "NEW_FILE"),
+        required=False,
+    )
+    return parser
+
+
+def parse_args(argv=None):
+    """
+    Parses and checks the command line of the CLI
+
+    Args:
+        argv (list, optional): Arguments to parse. Defaults to sys.argv[1:].
+
+    Returns:
+        (Namespace): Parsed flags
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if (args.list_runs or args.run_id) and not args.db_file:
+        parser.error("--runs and --run need --db")
+    if not args.hostname and not (
+        args.merge_files
+        or args.diff_files
+        or args.list_runs
+        or args.run_id
+        or args.source[1]
+    ):
+        parser.error("the following arguments are required: --hostname")
+    if args.source[1] and args.state_file:
+        parser.error("--incremental doesn't apply to --source mirrors")
+    if args.source[1] and (args.skip_forks or args.skip_archived or args.pushed_since):
+        parser.error(
+            "--skip-forks, --skip-archived and --pushed-since don't apply to --source mirrors"
+        )
+    if args.shard and not args.all_orgs:
+        parser.error("--shard only applies to --all")
+    if args.tree_depth is not None and args.tree_depth < 1:
+        parser.error("--tree-depth starts at 1, the root")
+    if tree_filter(args) and args.engine == "graphql" and not args.source[1]:
+        parser.error(
+            "--full-tree, --tree-depth and --tree-glob need --engine rest or async"
+        )
+    if args.parquet_file and args.resume_file:
+        parser.error(
+            "--parquet output can't be resumed, it is only readable once complete"
+        )
+    return args
+
+
+def tree_filter(args):
+    """
+    Returns:
+        (TreeFilter): Files of repo trees to list, None without --full-tree,
+        --tree-depth or --tree-glob
+    """
+    if not (args.full_tree or args.tree_depth or args.tree_globs):
+        return None
+    return TreeFilter(args.tree_depth, args.tree_globs)
+
+
+def cli_options(args):
+    """
+    Maps the parsed flags to the keyword arguments of GithubCli
+
+    Args:
+        args (Namespace): Flags returned by parse_args
+
+    Returns:
+        (dict): GithubCli keyword arguments
+    """
+    cache_dir = args.cache_dir if args.cache_dir else LOG_DIR + "cache/"
+    return {
+        "csv_file": args.csv_file,
+        "json_file": args.json_file,
+        "parquet_file": args.parquet_file,
+        "db_file": args.db_file,
+        "workers": max(args.workers, 1),
+        "engine": args.engine,
+        "cache_dir": cache_dir if not args.no_cache else None,
+        "cache_size": args.cache_size,
+        "state_file": args.state_file,
+        "profile": args.profile,
+        "log_format": args.log_format,
+        "language_views": args.language_views,
+        "shard": args.shard,
+        "shard_by": args.shard_by,
+        "tree_filter": tree_filter(args),
+        "skip_forks": args.skip_forks,
+        "skip_archived": args.skip_archived,
+        "pushed_since": args.pushed_since,
+    }
+
+
+def shard_of(login, count):
+    """
+    Shard of an org. Unlike hash(), crc32 gives every node and every run the
+    same answer.
+
+    Args:
+        login (String): Org login
+        count (Integer): Number of shards
+
+    Returns:
+        (Integer): Shard number from 1 to count
+    """
+    return zlib.crc32(login.lower().encode("utf-8")) % count + 1
+
+
+def balance_shards(sizes, count):
+    """
+    Assigns orgs to shards largest first, each to the shard with the fewest
+    repos so far. Ties go to the lowest login and shard so every node computes
+    the same assignment.
+
+    Args:
+        sizes (dict): Org login -> # of repos
+        count (Integer): Number of shards
+
+    Returns:
+        (dict): Org login -> shard number from 1 to count
+    """
+    loads = [0] * count
+    shards = {}
+    for login in sorted(sizes, key=lambda login: (-sizes[login], login)):
+        index = loads.index(min(loads))
+        loads[index] += sizes[login]
+        shards[login] = index + 1
+    return shards
+
+
+def source_spec(value):
+    """
+    Parses a --source value
+
+    Args:
+        value (String): api, or mirrors:<dir> for a dir of bare git mirrors
+
+    Returns:
+        (Tuple): "api" and None, or "mirrors" and the mirrors dir
+    """
+    if value == "api":
+        return "api", None
+    kind, _, path = value.partition(":")
+    if kind != "mirrors" or not path:
+        raise argparse.ArgumentTypeError(f"expected api or mirrors:<dir>, got {value}")
+    if not os.path.isdir(path):
+        raise argparse.ArgumentTypeError(f"{path} is not a directory")
+    return "mirrors", os.path.abspath(path)
+
+
+def git(mirror, *args):
+    """
+    Runs a git command against a bare mirror
+
+    Returns:
+        (String): Output of the command, empty if it failed
+    """
+    result = subprocess.run(
+        ["git", "--git-dir", mirror] + list(args),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    if result.returncode != 0:
+        return ""
+    return result.stdout.decode("utf-8", "replace")
+
+
+def remote_org_url(remote):
+    """
+    Web URL of the org of a git remote: https://host/org for
+    https://host/org/repo.git, ssh://git@host/org/repo.git,
+    git://host/org/repo.git or git@host:org/repo.git
+
+    Args:
+        remote (String): URL of a git remote
+
+    Returns:
+        String: URL of the org, None for a local path or a remote that doesn't parse
+    """
+    if "://" in remote:
+        url = urlparse(remote)
+        if url.scheme not in ("http", "https", "ssh", "git") or not url.hostname:
+            return None
+        if url.scheme in ("http", "https"):
+            # Credentials of the remote are left out
+            scheme, host = url.scheme, url.netloc.rsplit("@", 1)[-1]
+        else:
+            # The port of an ssh or git remote isn't the one of the web UI
+            scheme, host = "https", url.hostname
+        path = url.path
+    else:
+        # scp-like syntax, which git only assumes without a slash before the
+        # first colon and for more than a drive letter, a path otherwise
+        host, colon, path = remote.partition(":")
+        if not colon or "/" in host or len(host) < 2:
+            return None
+        scheme, host = "https", host.split("@")[-1]
+    org, _, _ = path.strip("/").rpartition("/")
+    if not host or not org:
+        return None
+    return f"{scheme}://{host}/{org}"
+
+
+def file_language(path):
+    """
+    Returns:
+        (String): Language of a file by its name or extension, None if unknown
+        or vendored
+    """
+    if path.startswith(MIRROR_VENDORED) or any(
+        f"/{directory}" in path for directory in MIRROR_VENDORED
+    ):
+        return None
+    name = path.rsplit("/", 1)[-1]
+    if name in MIRROR_LANGUAGES:
+        return MIRROR_LANGUAGES[name]
+    _, extension = os.path.splitext(name)
+    return MIRROR_LANGUAGES.get(extension.lower())
+
+
+def scan_mirror(mirror, known_tree=None, tree_filter=None):
+    """
+    Reads the root entries and the bytes per language of the default branch of
+    a bare mirror. Runs on the process pool of --source mirrors.
+
+    Args:
+        mirror (String): Path of the bare mirror
+        known_tree (String, optional): Root tree SHA of the previous run. Defaults to None.
+        tree_filter (TreeFilter, optional): Files of the tree to list. Defaults to None.
+
+    Returns:
+        Tuple: (root tree SHA, languages dict, root entries, error message,
+        tree files or None). Languages, root entries and tree files are None
+        if the tree is still known_tree.
+    """
+    tree = git(mirror, "rev-parse", "--verify", "--quiet", "HEAD^{tree}").strip()
+    if not tree:
+        # Same answer as the API for the contents of an empty repo
+        return None, {}, [], "This repository is empty.", [] if tree_filter else None
+    if tree == known_tree:
+        return tree, None, None, None, None
+    # Root entries are the first components of the recursive listing, in the
+    # same order, which saves a second ls-tree
+    root = {}
+    languages = {}
+    paths = [] if tree_filter else None
+    for entry in git(mirror, "ls-tree", "-r", "-l", "-z", tree).split("\0"):
+        if not entry:
+            continue
+        meta, path = entry.split("\t", 1)
+        root[path.split("/", 1)[0]] = None
+        _, kind, _, size = meta.split()
+        language = file_language(path) if kind == "blob" else None
+        if language:
+            languages[language] = languages.get(language, 0) + int(size)
+        if tree_filter and kind == "blob" and tree_filter.keep(path):
+            paths.append(path)
+    # Largest first like the API, so the first language is the core language
+    languages = dict(sorted(languages.items(), key=lambda x: (-x[1], x[0])))
+    return tree, languages, list(root), None, sorted(paths) if tree_filter else None
+
+
+def bytesto(bytes, to, bsize=1024):
+    """
+    Converts bytes to a specific type of size
+
+    Args:
+        bytes (Integer): Number of Bytes to convert
+        to (String): The requested size to covert to
+        bsize (int, optional): Defaults to 1024.
+
+    Returns:
+        (Float): Returns a converted byte size as a Float
+    """
+    a = {"k": 1, "m": 2, "g": 3, "t": 4, "p": 5, "e": 6}
+    r = float(bytes)
+    return bytes / (bsize ** a[to])
+
+
+def retry_after(value):
+    """
+    Args:
+        value (String): Retry-After header, in seconds or an HTTP date
+
+    Returns:
+        Float: Seconds to wait, a minute if the header can't be parsed
+    """
+    try:
+        return max(int(value), 0)
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return 60
+    return max(retry_at.timestamp() - time.time(), 0)
+
+
+class CachedResponse(object):
+    # mimic the httplib response object, like github.Requester.RequestsResponse
+    def __init__(self, status, headers, text):
+        self.status = status
+        self.headers = headers
+        self.text = text
+
+    def getheaders(self):
+        return self.headers.items()
+
+    def read(self):
+        return self.text
+
+
+class ResponseCache(object):
+    """
+    On-disk cache of GET responses keyed by URL, stored in SQLite.
+
+    Each entry keeps the ETag/Last-Modified validators of the response, which
+    are sent back as If-None-Match/If-Modified-Since. GHE answers unchanged
+    resources with a 304 that doesn't count against the rate limit, and the
+    cached body is replayed instead. Entries are evicted least recently used
+    first once the bodies exceed max_bytes.
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(
+            os.path.join(cache_dir, "responses.sqlite"),
+            check_same_thread=False,
+            isolation_level=None,
+        )
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                headers TEXT,
+                body TEXT,
+                size INTEGER,
+                accessed REAL
+            )
+            """
+        )
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)"
+        )
+        self.size = self.db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+
+    def validators(self, url):
+        """
+        Gets the conditional request headers for a cached URL
+
+        Args:
+            url (String): Requested URL
+
+        Returns:
+            dict: If-None-Match/If-Modified-Since headers, empty if not cached
+        """
+        with self.lock:
+            row = self.db.execute(
+                "SELECT etag, last_modified FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+        headers = {}
+        if row and row[0]:
+            headers["If-None-Match"] = row[0]
+        if row and row[1]:
+            headers["If-Modified-Since"] = row[1]
+        return headers
+
+    def replay(self, url, response_headers):
+        """
+        Builds a response from the cached entry of a URL answered with a 304
+
+        Args:
+            url (String): Requested URL
+            response_headers (dict): Headers of the 304, for fresh rate limits
+
+        Returns:
+            CachedResponse: Cached response, None if it was evicted meanwhile
+        """
+        with self.lock:
+            row = self.db.execute(
+                "SELECT headers, body FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.db.execute(
+                "UPDATE responses SET accessed = ? WHERE url = ?", (time.time(), url)
+            )
+            self.hits += 1
+        headers = json.loads(row[0])
+        for header, value in response_headers.items():
+            if header.lower().startswith("x-ratelimit"):
+                headers[header] = value
+        return CachedResponse(200, headers, row[1])
+
+    def store(self, url, response):
+        """
+        Stores a 200 response if it carries an ETag or Last-Modified validator
+
+        Args:
+            url (String): Requested URL
+            response (requests.Response): Response to store
+        """
+        with self.lock:
+            self.misses += 1
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+            if response.status_code != 200 or not (etag or last_modified):
+                return
+            body = response.text
+            previous = self.db.execute(
+                "SELECT size FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    url,
+                    etag,
+                    last_modified,
+                    json.dumps(dict(response.headers)),
+                    body,
+                    len(body),
+                    time.time(),
+                ),
+            )
+            self.size += len(body) - (previous[0] if previous else 0)
+            if self.size > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        # Drop least recently used entries down to 90% of the cap
+        target = self.max_bytes * 0.9
+        for url, size in self.db.execute(
+            "SELECT url, size FROM responses ORDER BY accessed"
+        ).fetchall():
+            if self.size <= target:
+                break
+            self.db.execute("DELETE FROM responses WHERE url = ?", (url,))
+            self.size -= size
+
+
+class RateLimiter(object):
+    """
+    Schedules requests across a pool of tokens from the X-RateLimit-* and
+    Retry-After headers of every response.
+
+    Requests rotate round robin over the tokens that have budget left. When a
+    token drops under RATE_LIMIT_PACING of its limit, its remaining requests
+    are spread evenly until the reset instead of running it dry, and a token
+    that was refused (primary or secondary limit) is parked until it may be
+    used again. Budgets are tracked per token and per API (core, graphql).
+    """
+
+    def __init__(self, tokens):
+        self.tokens = list(tokens)
+        self.budgets = {}
+        self.blocked = {}
+        self.next_token = 0
+        self.waited = 0.0
+        self.lock = threading.Lock()
+
+    def delay(self, token, resource, now):
+        # Seconds to wait before token may send a request to resource
+        wait = max(self.blocked.get(token, 0) - now, 0)
+        budget = self.budgets.get((token, resource))
+        if budget:
+            until_reset = max(budget["reset"] - now, 0)
+            if budget["remaining"] <= 0:
+                wait = max(wait, until_reset + 1)
+            elif budget["remaining"] < budget["limit"] * RATE_LIMIT_PACING:
+                wait = max(wait, min(budget["next"] - now, until_reset))
+        return wait
+
+    def acquire(self, resource):
+        """
+        Picks the token for the next request, sleeping if every token has to
+        be paced or is out of budget
+
+        Args:
+            resource (String): API the request goes to, core or graphql
+
+        Returns:
+            String: Token to authenticate the request with
+        """
+        token, wait = self.reserve(resource)
+        if wait > 0:
+            time.sleep(wait)
+        return token
+
+    def reserve(self, resource):
+        """
+        Books the next request on the best token without sleeping, for
+        callers that wait on their own (the async engine)
+
+        Args:
+            resource (String): API the request goes to, core or graphql
+
+        Returns:
+            Tuple: (token, seconds to wait before sending the request)
+        """
+        with self.lock:
+            now = time.time()
+            best, best_wait = None, None
+            for i in range(len(self.tokens)):
+                index = (self.next_token + i) % len(self.tokens)
+                wait = self.delay(self.tokens[index], resource, now)
+                if best is None or wait < best_wait:
+                    best, best_wait = index, wait
+                if wait == 0:
+                    break
+            self.next_token = (best + 1) % len(self.tokens)
+            token = self.tokens[best]
+            budget = self.budgets.get((token, resource))
+            if budget:
+                # Book the request now so concurrent workers see the budget shrink
+                budget["remaining"] -= 1
+                if budget["remaining"] > 0:
+                    interval = max(budget["reset"] - now, 0) / budget["remaining"]
+                    budget["next"] = max(now, budget["next"]) + interval
+            self.waited += best_wait
+        if best_wait > 5:
+            log.info(f"[.] Rate limit: waiting {best_wait:.0f} seconds")
+        return token, best_wait
+
+    def update(self, token, resource, response):
+        """
+        Records the rate limit headers of a response
+
+        Args:
+            token (String): Token the request was sent with
+            resource (String): API the request went to, core or graphql
+            response (requests.Response): Response of the request
+
+        Returns:
+            Boolean: True if the request was refused by a rate limit and has
+            to be sent again
+        """
+        headers = response.headers
+        with self.lock:
+            if "X-RateLimit-Remaining" in headers:
+                budget = self.budgets.setdefault((token, resource), {"next": 0})
+                reset = int(headers.get("X-RateLimit-Reset", 0))
+                if budget.get("reset") != reset:
+                    # New rate limit window, drop the pacing of the old one
+                    budget["next"] = 0
+                budget["remaining"] = int(headers["X-RateLimit-Remaining"])
+                budget["limit"] = int(headers.get("X-RateLimit-Limit", 5000))
+                budget["reset"] = reset
+            if response.status_code not in (403, 429):
+                return False
+            if "Retry-After" in headers:
+                self.blocked[token] = time.time() + retry_after(headers["Retry-After"])
+                return True
+            if headers.get("X-RateLimit-Remaining") == "0":
+                # Primary limit, delay() holds the token until the reset
+                return True
+            if "rate limit" in response.text.lower():
+                # Secondary limit without Retry-After, GitHub asks for a minute
+                self.blocked[token] = time.time() + 60
+                return True
+        return False
+
+    def summary(self):
+        """
+        Returns:
+            List: One line per token and API with its remaining budget
+        """
+        lines = []
+        for (token, resource), budget in sorted(
+            self.budgets.items(), key=lambda item: self.tokens.index(item[0][0])
+        ):
+            reset = datetime.datetime.fromtimestamp(budget["reset"]).strftime(
+                "%H:%M:%S"
+            )
+            lines.append(
+                f"token #{self.tokens.index(token) + 1} {resource}: {budget['remaining']}/{budget['limit']} left, resets at {reset}"
+            )
+        return lines
+
+
+class Profiler(object):
+    """
+    Accounts every HTTP request of a run to the phase it belongs to, found
+    from its URL: org listing, repo listing, languages, contents, GraphQL,
+    and lazy completion for anything else (PyGithub fetching an object's
+    missing attributes, like org.email). Keeps the latencies and bytes of
+    each phase and the requests made for each repo.
+    """
+
+    # Requests a repo is expected to cost: its languages and contents
+    REPO_CALLS = {"languages", "contents"}
+
+    def __init__(self):
+        self.phases = {}
+        self.repo_calls = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def phase(url):
+        path = urlparse(url).path.rstrip("/")
+        if path.endswith("/graphql"):
+            return "graphql", None
+        if path.endswith("/organizations"):
+            return "org listing", None
+        match = re.search(r"/orgs/[^/]+/repos$", path)
+        if match:
+            return "repo listing", None
+        match = re.search(r"/repos/([^/]+/[^/]+)(?:/([^/]+))?", path)
+        if match and match.group(2) in Profiler.REPO_CALLS:
+            return match.group(2), match.group(1)
+        return "lazy completion", match.group(1) if match else None
+
+    def record(self, verb, url, status, seconds, size):
+        """
+        Args:
+            verb (String): HTTP method
+            url (String): Requested URL
+            status (Integer): Response status
+            seconds (Float): Latency of the request
+            size (Integer): Bytes of the response body
+        """
+        phase, repo = self.phase(url)
+        with self.lock:
+            stats = self.phases.setdefault(
+                phase, {"latencies": [], "bytes": 0, "statuses": {}}
+            )
+            stats["latencies"].append(seconds)
+            stats["bytes"] += size
+            stats["statuses"][status] = stats["statuses"].get(status, 0) + 1
+            if repo:
+                self.repo_calls.setdefault(repo, []).append(phase)
+
+    @staticmethod
+    def percentile(values, percent):
+        # Nearest rank percentile of sorted values
+        index = max(int(round(percent / 100.0 * len(values) + 0.5)) - 1, 0)
+        return values[min(index, len(values) - 1)]
+
+    def report(self):
+        """
+        Returns:
+            dict: Requests, latency percentiles and bytes per phase, plus the
+            repos that needed more requests than their languages and contents
+        """
+        phases = {}
+        with self.lock:
+            for phase, stats in self.phases.items():
+                latencies = sorted(stats["latencies"])
+                phases[phase] = {
+                    "requests": len(latencies),
+                    "p50_ms": round(self.percentile(latencies, 50) * 1000, 1),
+                    "p95_ms": round(self.percentile(latencies, 95) * 1000, 1),
+                    "p99_ms": round(self.percentile(latencies, 99) * 1000, 1),
+                    "total_s": round(sum(latencies), 3),
+                    "bytes": stats["bytes"],
+                    "statuses": {str(k): v for k, v in stats["statuses"].items()},
+                }
+            extra_calls = {
+                repo: calls
+                for repo, calls in self.repo_calls.items()
+                if len(calls) > len(self.REPO_CALLS)
+                or not set(calls) <= self.REPO_CALLS
+            }
+        return {"phases": phases, "repos_with_extra_calls": extra_calls}
+
+    def table(self, report):
+        return [
+            [
+                phase,
+                stats["requests"],
+                stats["p50_ms"],
+                stats["p95_ms"],
+                stats["p99_ms"],
+                round(bytesto(stats["bytes"], to="k"), 1),
+            ]
+            for phase, stats in sorted(
+                report["phases"].items(), key=lambda item: -item[1]["requests"]
+            )
+        ]
+
+
+class LanguageStats(object):
+    """
+    Language totals updated as repos are reported, so every view is ready at
+    the end without another pass over the rows. For each language it keeps
+    the # of repos using it, their bytes and a log scale histogram of its size
+    in each repo for the median, enterprise wide and the repos and bytes per
+    org. Counters are arrays indexed by language number.
+    """
+
+    def __init__(self):
+        self.names = []
+        self.numbers = {}
+        self.repos = array("q")
+        self.bytes = array("q")
+        self.sizes = []
+        # org -> [# of repos, repos per language, bytes per language]
+        self.orgs = {}
+
+    def number(self, name):
+        number = self.numbers.get(name)
+        if number is None:
+            number = self.numbers[name] = len(self.names)
+            self.names.append(name)
+            self.repos.append(0)
+            self.bytes.append(0)
+            self.sizes.append(array("q", [0]) * SIZE_BUCKETS)
+        return number
+
+    @staticmethod
+    def bucket(size):
+        if size < 1:
+            return 0
+        bucket = 1 + int(math.log2(size) * SIZE_BUCKETS_PER_DOUBLING)
+        return min(bucket, SIZE_BUCKETS - 1)
+
+    def add(self, org_login, languages):
+        """
+        Args:
+            org_login (String): Org of the repo
+            languages (dict): Languages of the repo and their byte sizes, None
+                if unknown
+        """
+        org = self.orgs.get(org_login)
+        if org is None:
+            org = self.orgs[org_login] = [0, array("q"), array("q")]
+        org[0] += 1
+        for name, size in languages.items():
+            number = self.number(name)
+            if len(org[1]) <= number:
+                org[1].extend([0] * (len(self.names) - len(org[1])))
+                org[2].extend([0] * (len(self.names) - len(org[2])))
+            self.repos[number] += 1
+            org[1][number] += 1
+            if size is not None:
+                self.bytes[number] += size
+                self.sizes[number][self.bucket(size)] += 1
+                org[2][number] += size
+
+    def median(self, number):
+        histogram = self.sizes[number]
+        half = sum(histogram) / 2.0
+        seen = 0
+        for bucket, count in enumerate(histogram):
+            seen += count
+            if count and seen >= half:
+                if not bucket:
+                    return 0
+                # Geometric middle of the bucket
+                return round(2 ** ((bucket - 0.5) / SIZE_BUCKETS_PER_DOUBLING))
+        return None
+
+    def share(self, size, total):
+        return f"{100.0 * size / total:.1f}%" if total else "-"
+
+    def table(self):
+        """
+        Returns:
+            List: Language, # of repos, bytes, share of all bytes and median
+            bytes per repo, largest first
+        """
+        total = sum(self.bytes)
+        table = [
+            [
+                name,
+                self.repos[number],
+                self.bytes[number],
+                self.share(self.bytes[number], total),
+                self.median(number),
+            ]
+            for number, name in enumerate(self.names)
+        ]
+        table.sort(key=lambda row: (-row[2], -row[1], row[0]))
+        return table
+
+    def org_table(self, top=3):
+        """
+        Args:
+            top (Integer, optional): Languages listed per org. Defaults to 3.
+
+        Returns:
+            List: Org, # of repos, bytes and its top languages by share of
+            bytes, largest first
+        """
+        table = []
+        for login, (repo_count, repos, sizes) in self.orgs.items():
+            total = sum(sizes)
+            ranked = sorted(
+                range(len(sizes)), key=lambda n: (-sizes[n], -repos[n], self.names[n])
+            )
+            languages = ", ".join(
+                f"{self.names[n]} {self.share(sizes[n], total)}"
+                for n in ranked[:top]
+                if repos[n]
+            )
+            table.append([login, repo_count, total, languages])
+        table.sort(key=lambda row: (-row[2], -row[1], row[0]))
+        return table
+
+    def state(self):
+        # JSON for checkpoints, histograms without their trailing empty buckets
+        return {
+            "names": self.names,
+            "repos": self.repos.tolist(),
+            "bytes": self.bytes.tolist(),
+            "sizes": [
+                [[bucket, count] for bucket, count in enumerate(histogram) if count]
+                for histogram in self.sizes
+            ],
+            "orgs": {
+                login: [repo_count, repos.tolist(), sizes.tolist()]
+                for login, (repo_count, repos, sizes) in self.orgs.items()
+            },
+        }
+
+    def load(self, state):
+        for number, name in enumerate(state["names"]):
+            self.number(name)
+            self.repos[number] = state["repos"][number]
+            self.bytes[number] = state["bytes"][number]
+            for bucket, count in state["sizes"][number]:
+                self.sizes[number][bucket] = count
+        for login, (repo_count, repos, sizes) in state["orgs"].items():
+            self.orgs[login] = [repo_count, array("q", repos), array("q", sizes)]
+
+
+class TreeFilter(object):
+    """
+    Files of repo trees listed by --full-tree, --tree-depth and --tree-glob.
+    A glob with a / matches the whole path, one without matches the file name
+    at any depth, like in .gitignore.
+    """
+
+    def __init__(self, depth=None, globs=None):
+        self.depth = depth
+        self.globs = list(globs) if globs else []
+
+    def key(self):
+        # Trees cached under another filter are stale
+        return json.dumps([self.depth, self.globs])
+
+    def descend(self, path):
+        # Whether the directory at path may hold files within the depth limit
+        return self.depth is None or path.count("/") + 1 < self.depth
+
+    def keep(self, path):
+        if self.depth is not None and path.count("/") >= self.depth:
+            return False
+        if not self.globs:
+            return True
+        name = path.rsplit("/", 1)[-1]
+        return any(
+            fnmatch.fnmatchcase(path if "/" in glob else name, glob)
+            for glob in self.globs
+        )
+
+    def walk(self, ref):
+        """
+        Lists the kept files of the tree of ref through the git trees API, in
+        one recursive listing. A truncated listing is walked again one level at
+        a time, listing each subtree recursively. The caller makes the
+        requests, so both engines share the walk: each (tree sha, recursive)
+        yielded is sent back its decoded listing.
+
+        Args:
+            ref (String): Branch or tree sha
+
+        Returns:
+            List: Paths of the kept files, sorted
+        """
+        paths = []
+        pending = [("", ref, self.depth != 1)]
+        while pending:
+            prefix, sha, recursive = pending.pop()
+            listing = yield sha, recursive
+            if recursive and listing.get("truncated"):
+                pending.append((prefix, sha, False))
+                continue
+            for entry in listing["tree"]:
+                path = prefix + entry["path"]
+                if entry["type"] == "blob":
+                    if self.keep(path):
+                        paths.append(path)
+                elif entry["type"] == "tree" and not recursive and self.descend(path):
+                    pending.append((path + "/", entry["sha"], True))
+        return sorted(paths)
+
+
+class SessionConnection(object):
+    """
+    httplib-style connection handed to PyGithub's Requester.
+
+    PyGithub keeps a single connection object and stores the pending request
+    on it, so it can't be shared between threads. Injecting this class makes
+    the Requester create one per request, while the underlying keep-alive
+    pool is a single requests.Session shared by all worker threads.
+    """
+
+    protocol = "https"
+    pool_size = 10
+    session = None
+    cache = None
+    limiter = None
+    profiler = None
+    lock = threading.Lock()
+
+    def __init__(self, host, port=None, timeout=None, retry=None, **kwargs):
+        self.host = host
+        self.port = port if port else (443 if self.protocol == "https" else 80)
+        self.timeout = timeout
+        self.retry = retry
+        self.verify = kwargs.get("verify", True)
+
+    @classmethod
+    def configure(cls, pool_size):
+        """
+        Sets the size of the shared connection pool, one slot per worker
+
+        Args:
+            pool_size (Integer): Maximum number of pooled connections
+        """
+        SessionConnection.pool_size = max(pool_size, 10)
+        SessionConnection.session = None
+
+    @classmethod
+    def get_session(cls, retry=None):
+        with SessionConnection.lock:
+            if SessionConnection.session is None:
+                import requests
+
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(
+                    max_retries=retry if retry is not None else 0,
+                    pool_connections=SessionConnection.pool_size,
+                    pool_maxsize=SessionConnection.pool_size,
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                SessionConnection.session = session
+            return SessionConnection.session
+
+    def request(self, verb, url, input, headers):
+        self.verb = verb
+        self.url = url
+        self.input = input
+        self.headers = headers
+
+    def getresponse(self):
+        url = f"{self.protocol}://{self.host}:{self.port}{self.url}"
+        cache = self.cache if self.verb == "GET" else None
+        headers = dict(self.headers)
+        if cache:
+            headers.update(cache.validators(url))
+        r = self.send(url, headers)
+        if cache:
+            if r.status_code == 304:
+                cached = cache.replay(url, r.headers)
+                if cached:
+                    return cached
+                # Evicted after the validators were sent, fetch it again
+                self.headers = {
+                    k: v for k, v in headers.items() if not k.startswith("If-")
+                }
+                return self.getresponse()
+            cache.store(url, r)
+        from github.Requester import RequestsResponse
+
+        return RequestsResponse(r)
+
+    def send(self, url, headers):
+        resource = "graphql" if self.url.endswith("/graphql") else "core"
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            if self.limiter:
+                token = self.limiter.acquire(resource)
+                headers["Authorization"] = f"token {token}"
+            started = time.perf_counter()
+            r = self.get_session(self.retry).request(
+                self.verb,
+                url,
+                headers=headers,
+                data=self.input,
+                timeout=self.timeout,
+                verify=self.verify,
+                allow_redirects=False,
+            )
+            if self.profiler:
+                self.profiler.record(
+                    self.verb,
+                    url,
+                    r.status_code,
+                    time.perf_counter() - started,
+                    len(r.content),
+                )
+            if not self.limiter or not self.limiter.update(token, resource, r):
+                break
+        return r
+
+    def close(self):
+        return
+
+
+class HTTPSessionConnection(SessionConnection):
+    protocol = "http"
+
+
+class JsonObject(object):
+    """
+    Read-only attribute view of a JSON object returned by the async engine,
+    standing in for the PyGithub objects. Nested objects are wrapped too and
+    *_at timestamps are parsed like PyGithub does.
+    """
+
+    def __init__(self, data):
+        self._data = data
+
+    def __getattr__(self, name):
+        try:
+            value = self._data[name]
+        except KeyError:
+            raise AttributeError(name)
+        if isinstance(value, dict):
+            return JsonObject(value)
+        if name.endswith("_at") and value:
+            return datetime.datetime.strptime(value, "%Y-%m-%dT%H:%M:%SZ")
+        return value
+
+    def complete(self, data):
+        self._data.update(data)
+
+
+# What the async engine needs of a requests.Response for the limiter and cache
+FetchedResponse = namedtuple("FetchedResponse", ["status_code", "headers", "text"])
+
+
+class LazyMessage(object):
+    """
+    Log message rendered by render(*args) only when the log listener thread
+    writes it out
+    """
+
+    def __init__(self, render, *args):
+        self.render = render
+        self.args = args
+
+    def __str__(self):
+        return self.render(*self.args)
+
+
+def render_org(login, email, html_url):
+    return "\n".join(
+        [
+            f"\n{colored('Organization', color='blue', attrs=['bold', 'underline'])}: {login}",
+            f"{colored('Owner', color='blue', attrs=['bold', 'underline'])}: {email}",
+            f"{colored('Org Url', color='blue', attrs=['bold', 'underline'])}: {html_url}",
+            f"{colored('Repos', color='blue', attrs=['bold', 'underline'])}:",
+        ]
+    )
+
+
+def render_repo(name, language, languages, contents, error, tree=None):
+    lines = [f"[!] {error}"] if error else []
+    lines.append(f" |")
+    lines.append(f" |- {colored(f'Repo Name', color='green')}: {name}")
+    lines.append(f" |- {colored(f'Core Language', color='green')}: {language}")
+    lines.append(f" |- {colored(f'Languages:', color='green')}")
+    for language, byte_size in languages.items():
+        byte_size = bytesto(byte_size, to="k")
+        lines.append(f"  |")
+        lines.append(f"   |- {colored(f'Language: {language}', attrs=['bold'])}")
+        lines.append(f"   |- {colored(f'Byte Size: {byte_size} KB', attrs=['bold'])}")
+    lines.append(f" |- {colored(f'Root Content Files:', color='green')}")
+    lines.append(f"  |")
+    for content in contents:
+        lines.append(f"   | * {colored(f'{content.path}', attrs=['bold'])}")
+    if tree is not None:
+        lines.append(f" |- {colored(f'Tree Files:', color='green')}")
+        lines.append(f"  |")
+        for path in tree:
+            lines.append(f"   | * {colored(f'{path}', attrs=['bold'])}")
+    return "\n".join(lines)
+
+
+def render_repo_event(org, name, language, languages, contents, error, tree=None):
+    event = {
+        "event": "repo",
+        "org": org,
+        "repo": name,
+        "language": language,
+        "languages": languages,
+        "root_files": [content.path for content in contents],
+        "error": error,
+    }
+    if tree is not None:
+        event["tree_files"] = tree
+    return json.dumps(event)
+
+
+def snapshot_record(row):
+    # Columns of an output row compared by --diff
+    return (
+        row["org"],
+        row["repo_name"],
+        row["repo_lang"],
+        row["repo_langs"],
+        row["repo_tld"],
+    )
+
+
+def render_change(change):
+    name = f"{change['org']}/{change['repo']}"
+    if change["event"] == "repo_added":
+        return f"{colored('[+]', color='green')} {name} ({change['language']})"
+    if change["event"] == "repo_deleted":
+        return f"{colored('[-]', color='red')} {name} ({change['language']})"
+    parts = []
+    if "language" in change:
+        parts.append("core language {} -> {}".format(*change["language"]))
+    for key, label in (("root_files", "root files"), ("languages", "languages")):
+        files = [f"+{x}" for x in change.get(f"{key}_added", [])]
+        files += [f"-{x}" for x in change.get(f"{key}_removed", [])]
+        if files:
+            parts.append(f"{label} {' '.join(files)}")
+    return f"{colored('[~]', color='yellow')} {name}: {', '.join(parts)}"
+
+
+class RowSink(object):
+    """
+    Output file that _repo rows are appended to as soon as they are mined.
+    Every row is flushed so the file can be tailed during the crawl, and the
+    file is fsynced every SYNC_INTERVAL seconds. Subclasses define
+    format(row), the text written for a row.
+    """
+
+    def __init__(self, path, offset=None):
+        self.path = path
+        if offset is None:
+            self.file = open(path, "w")
+        else:
+            # Resuming: drop whatever was written after the checkpoint
+            self.file = open(path, "a")
+            self.file.truncate(offset)
+        self.synced = time.time()
+
+    def offset(self):
+        self.file.flush()
+        return self.file.tell()
+
+    def write(self, row, languages=None):
+        self.file.write(self.format(row))
+        self.file.flush()
+        if time.time() - self.synced >= SYNC_INTERVAL:
+            os.fsync(self.file.fileno())
+            self.synced = time.time()
+
+    def close(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+
+
+class CsvSink(RowSink):
+    fieldnames = [
+        "org",
+        "org_owner",
+        "org_url",
+        "repo_name",
+        "repo_lang",
+        "repo_langs",
+        "repo_tld",
+    ]
+
+    def __init__(self, path, offset=None, tree=False):
+        super().__init__(path, offset)
+        self.buffer = io.StringIO()
+        # repo_tree is only there with --full-tree, --tree-depth or --tree-glob,
+        # the one of merged --full-tree shards is dropped otherwise
+        fieldnames = self.fieldnames + ["repo_tree"] if tree else self.fieldnames
+        self.csvwriter = csv.DictWriter(
+            self.buffer, fieldnames=fieldnames, extrasaction="ignore"
+        )
+        if offset is None:
+            self.csvwriter.writeheader()
+            self.file.write(self.buffer.getvalue())
+
+    def format(self, row):
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        self.csvwriter.writerow(row)
+        return self.buffer.getvalue()
+
+
+class JsonlSink(RowSink):
+    def format(self, row):
+        return json.dumps(row) + "\n"
+
+
+class ParquetSink(object):
+    """
+    Parquet output with typed columns: org fields and the core language are
+    dictionary encoded, repo_langs is a list of (name, bytes) structs and
+    repo_tld and repo_tree lists of strings. Rows are buffered and written out
+    as a row group every PARQUET_ROW_GROUP rows, the file is readable once
+    closed.
+    """
+
+    def __init__(self, path, tree=False):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError(
+                "--parquet needs pyarrow, install it with: pip3 install pyarrow"
+            )
+        self.pa = pyarrow
+        self.path = path
+        text = pyarrow.dictionary(pyarrow.int32(), pyarrow.string())
+        language = pyarrow.struct(
+            [("name", pyarrow.string()), ("bytes", pyarrow.int64())]
+        )
+        fields = [
+            ("org", text),
+            ("org_owner", text),
+            ("org_url", text),
+            ("repo_name", pyarrow.string()),
+            ("repo_lang", text),
+            ("repo_langs", pyarrow.list_(language)),
+            ("repo_tld", pyarrow.list_(pyarrow.string())),
+        ]
+        if tree:
+            fields.append(("repo_tree", pyarrow.list_(pyarrow.string())))
+        self.schema = pyarrow.schema(fields)
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+        self.rows = {name: [] for name in self.schema.names}
+
+    def offset(self):
+        # Row groups aren't readable before the footer is written on close
+        return None
+
+    def write(self, row, languages=None):
+        for name in self.schema.names:
+            if name != "repo_langs":
+                self.rows[name].append(row.get(name))
+        if languages is None:
+            # Rows merged from CSV/JSONL outputs only have the language names
+            languages = dict.fromkeys(row["repo_langs"])
+        self.rows["repo_langs"].append(
+            [{"name": name, "bytes": size} for name, size in languages.items()]
+        )
+        if len(self.rows["org"]) >= PARQUET_ROW_GROUP:
+            self.write_row_group()
+
+    def write_row_group(self):
+        if self.rows["org"]:
+            self.writer.write_table(
+                self.pa.Table.from_pydict(self.rows, schema=self.schema)
+            )
+            self.rows = {name: [] for name in self.schema.names}
+
+    def close(self):
+        self.write_row_group()
+        self.writer.close()
+
+
+class DbSink(object):
+    """
+    SQLite inventory that every run adds its rows to, normalized into orgs,
+    repos, repo_languages, root_entries and tree_entries. Orgs and repos carry
+    the id of their run, whose start and end times are kept in runs. Rows are
+    committed DB_BATCH repos at a time and at every checkpoint.
+    """
+
+    def __init__(self, path, offset=None):
+        self.path = path
+        # mine() writes from its mining thread, one thread at a time
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS runs (
+                id INTEGER PRIMARY KEY,
+                started_at TEXT,
+                finished_at TEXT,
+                command TEXT,
+                org_count INTEGER,
+                repo_count INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS orgs (
+                id INTEGER PRIMARY KEY,
+                run_id INTEGER REFERENCES runs (id),
+                login TEXT,
+                email TEXT,
+                html_url TEXT
+            );
+            CREATE TABLE IF NOT EXISTS repos (
+                id INTEGER PRIMARY KEY,
+                run_id INTEGER REFERENCES runs (id),
+                org_id INTEGER REFERENCES orgs (id),
+                name TEXT,
+                language TEXT
+            );
+            CREATE TABLE IF NOT EXISTS repo_languages (
+                repo_id INTEGER REFERENCES repos (id),
+                name TEXT,
+                bytes INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS root_entries (
+                repo_id INTEGER REFERENCES repos (id),
+                path TEXT
+            );
+            CREATE TABLE IF NOT EXISTS tree_entries (
+                repo_id INTEGER REFERENCES repos (id),
+                path TEXT
+            );
+            CREATE INDEX IF NOT EXISTS orgs_login ON orgs (login, run_id);
+            CREATE INDEX IF NOT EXISTS repos_org ON repos (org_id);
+            CREATE INDEX IF NOT EXISTS repos_name ON repos (name, run_id);
+            CREATE INDEX IF NOT EXISTS repos_language ON repos (run_id, language);
+            CREATE INDEX IF NOT EXISTS repo_languages_repo ON repo_languages (repo_id);
+            CREATE INDEX IF NOT EXISTS repo_languages_name ON repo_languages (name);
+            CREATE INDEX IF NOT EXISTS root_entries_repo ON root_entries (repo_id);
+            CREATE INDEX IF NOT EXISTS tree_entries_repo ON tree_entries (repo_id);
+            CREATE INDEX IF NOT EXISTS tree_entries_path ON tree_entries (path);
+            """
+        )
+        if offset is None:
+            self.run_id = self.db.execute(
+                "INSERT INTO runs (started_at, command) VALUES (?, ?)",
+                (datetime.datetime.now().isoformat(), " ".join(sys.argv[1:])),
+            ).lastrowid
+        else:
+            # Resuming: drop whatever was written after the checkpoint
+            self.run_id, org_id, repo_id = offset
+            for table in ("repo_languages", "root_entries", "tree_entries"):
+                self.db.execute(
+                    f"""
+                    DELETE FROM {table} WHERE repo_id IN (
+                        SELECT id FROM repos WHERE run_id = ? AND id > ?
+                    )
+                    """,
+                    (self.run_id, repo_id),
+                )
+            self.db.execute(
+                "DELETE FROM repos WHERE run_id = ? AND id > ?", (self.run_id, repo_id)
+            )
+            self.db.execute(
+                "DELETE FROM orgs WHERE run_id = ? AND id > ?", (self.run_id, org_id)
+            )
+        self.org_ids = dict(
+            self.db.execute(
+                "SELECT login, id FROM orgs WHERE run_id = ?", (self.run_id,)
+            ).fetchall()
+        )
+        self.db.commit()
+        self.pending = 0
+
+    def offset(self):
+        self.db.commit()
+        self.pending = 0
+        return [
+            self.run_id,
+            max(self.org_ids.values(), default=0),
+            self.db.execute(
+                "SELECT COALESCE(MAX(id), 0) FROM repos WHERE run_id = ?",
+                (self.run_id,),
+            ).fetchone()[0],
+        ]
+
+    def write(self, row, languages=None):
+        org_id = self.org_ids.get(row["org"])
+        if org_id is None:
+            org_id = self.db.execute(
+                "INSERT INTO orgs (run_id, login, email, html_url) VALUES (?, ?, ?, ?)",
+                (self.run_id, row["org"], row["org_owner"], row["org_url"]),
+            ).lastrowid
+            self.org_ids[row["org"]] = org_id
+        repo_id = self.db.execute(
+            "INSERT INTO repos (run_id, org_id, name, language) VALUES (?, ?, ?, ?)",
+            (self.run_id, org_id, row["repo_name"], row["repo_lang"]),
+        ).lastrowid
+        if languages is None:
+            # Rows merged from CSV/JSONL outputs only have the language names
+            languages = dict.fromkeys(row["repo_langs"])
+        self.db.executemany(
+            "INSERT INTO repo_languages (repo_id, name, bytes) VALUES (?, ?, ?)",
+            [(repo_id, name, size) for name, size in languages.items()],
+        )
+        self.db.executemany(
+            "INSERT INTO root_entries (repo_id, path) VALUES (?, ?)",
+            [(repo_id, path) for path in row["repo_tld"]],
+        )
+        if row.get("repo_tree"):
+            self.db.executemany(
+                "INSERT INTO tree_entries (repo_id, path) VALUES (?, ?)",
+                [(repo_id, path) for path in row["repo_tree"]],
+            )
+        self.pending += 1
+        if self.pending >= DB_BATCH:
+            self.db.commit()
+            self.pending = 0
+
+    def finish_run(self, org_count, repo_count):
+        self.db.execute(
+            "UPDATE runs SET finished_at = ?, org_count = ?, repo_count = ? WHERE id = ?",
+            (datetime.datetime.now().isoformat(), org_count, repo_count, self.run_id),
+        )
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
+class MiningStopped(BaseException):
+    """
+    Raised in the mining thread when the caller of mine() stops iterating.
+    Like GeneratorExit, it isn't an Exception so the per org error handling
+    lets it through.
+    """
+
+
+class QueueSink(object):
+    """
+    Hands rows over to the iterator of mine() through a bounded queue, so
+    mining never runs far ahead of the caller
+    """
+
+    def __init__(self, size=1000):
+        self.queue = queue.Queue(size)
+        self.stopped = False
+
+    def offset(self):
+        return None
+
+    def put(self, item):
+        # Polls so a caller that stopped iterating can't leave it blocked
+        while not self.stopped:
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def write(self, row, languages=None):
+        if not self.put(row):
+            raise MiningStopped()
+
+    def close(self):
+        return
+
+
+# Stand-ins for the PyGithub objects report_repo reads, built from GraphQL data
+# or local mirrors
+GraphqlOrg = namedtuple("GraphqlOrg", ["login", "email", "html_url"])
+GraphqlRepo = namedtuple("GraphqlRepo", ["name", "language"])
+# Root content file, only its path is kept of the contents API answer
+RootContent = namedtuple("RootContent", ["path"])
+# Owner of a ListedRepo, one per org
+RepoOwner = namedtuple("RepoOwner", ["login"])
+
+
+class StringPool(object):
+    """
+    Interns values repeated across repos, like org logins, language names
+    and root paths, so the repos waiting to be reported hold references to
+    one shared copy instead of a copy each. Immutable records made of such
+    strings, like RootContent, are interned the same way.
+    """
+
+    def __init__(self):
+        self.values = {}
+
+    def __call__(self, value):
+        if value is None:
+            return None
+        # setdefault is atomic, so the worker threads share the pool unlocked
+        return self.values.setdefault(value, value)
+
+    def __len__(self):
+        return len(self.values)
+
+
+class ListedRepo(object):
+    """
+    Repo of an org's repo listing, with only the fields mining reads. The
+    PyGithub Repository and JSON objects keep the whole API answer, about 100
+    fields, for as long as the repo waits in the work queue of --all.
+
+    Args:
+        data (dict): Repo of the listing, as returned by the API
+        strings (StringPool): Pool interning the owner, language and branch
+    """
+
+    __slots__ = (
+        "owner",
+        "name",
+        "language",
+        "size",
+        "fork",
+        "archived",
+        "pushed_at",
+        "default_branch",
+    )
+
+    def __init__(self, data, strings):
+        self.owner = strings(RepoOwner(strings(data["owner"]["login"])))
+        self.name = data["name"]
+        self.language = strings(data["language"])
+        self.size = data["size"]
+        self.fork = data["fork"]
+        self.archived = data["archived"]
+        self.pushed_at = (
+            datetime.datetime.strptime(data["pushed_at"], "%Y-%m-%dT%H:%M:%SZ")
+            if data["pushed_at"]
+            else None
+        )
+        self.default_branch = strings(data["default_branch"])
+
+    @property
+    def full_name(self):
+        return f"{self.owner.login}/{self.name}"
+
+
+class SnapshotDiff(object):
+    """
+    Changes between an old and a new snapshot of the enterprise, compared repo
+    by repo as the partitions of --diff are joined on org/repo. Totals for the
+    summary and tables are kept across partitions, so only one partition of
+    repos is in memory at a time. A repo is a (core language, languages, root
+    files) record of tuples.
+    """
+
+    def __init__(self):
+        self.old_repos = 0
+        self.new_repos = 0
+        self.added = 0
+        self.deleted = 0
+        self.changed = 0
+        self.language_changes = 0
+        self.old_orgs = set()
+        self.new_orgs = set()
+        # language -> [# of repos in the old snapshot, in the new one]
+        self.languages = {}
+        # root file -> [# of repos it appeared in, vanished from]
+        self.root_files = {}
+
+    def count(self, org_login, record, side):
+        (self.old_orgs, self.new_orgs)[side].add(org_login)
+        self.languages.setdefault(record[0], [0, 0])[side] += 1
+
+    def compare(self, org_login, name, before, after):
+        """
+        Args:
+            org_login (String): Org of the repo
+            name (String): Name of the repo
+            before (tuple): Record of the repo in the old snapshot, None if new
+            after (tuple): Record of the repo in the new snapshot, None if
+                deleted
+
+        Returns:
+            dict: Change event of the repo, None if it didn't change
+        """
+        if before is not None:
+            self.old_repos += 1
+            self.count(org_login, before, 0)
+        if after is not None:
+            self.new_repos += 1
+            self.count(org_login, after, 1)
+        if before is None:
+            self.added += 1
+            event = {"event": "repo_added", "org": org_login, "repo": name}
+            return dict(event, language=after[0])
+        if after is None:
+            self.deleted += 1
+            event = {"event": "repo_deleted", "org": org_login, "repo": name}
+            return dict(event, language=before[0])
+        if before == after:
+            return None
+        change = {"event": "repo_changed", "org": org_login, "repo": name}
+        if before[0] != after[0]:
+            self.language_changes += 1
+            change["language"] = [before[0], after[0]]
+        # Only which languages and root files are there counts, not their order
+        for key, n in (("languages", 1), ("root_files", 2)):
+            if before[n] != after[n]:
+                old, new = set(before[n]), set(after[n])
+                if new - old:
+                    change[f"{key}_added"] = sorted(new - old)
+                if old - new:
+                    change[f"{key}_removed"] = sorted(old - new)
+        if len(change) == 3:
+            return None
+        for path in change.get("root_files_added", []):
+            self.root_files.setdefault(path, [0, 0])[0] += 1
+        for path in change.get("root_files_removed", []):
+            self.root_files.setdefault(path, [0, 0])[1] += 1
+        self.changed += 1
+        return change
+
+    def language_table(self):
+        """
+        Returns:
+            List: Core language, # of repos in the old and new snapshot and
+            the difference, largest change first
+        """
+        table = [
+            [language or "Empty", old, new, new - old]
+            for language, (old, new) in self.languages.items()
+        ]
+        table.sort(key=lambda row: (-abs(row[3]), -row[2], row[0]))
+        for row in table:
+            row[3] = f"{row[3]:+d}"
+        return table
+
+    def root_file_table(self, top=DIFF_TOP_FILES):
+        """
+        Args:
+            top (Integer, optional): Root files listed. Defaults to
+                DIFF_TOP_FILES.
+
+        Returns:
+            List: Root file and the # of kept repos it appeared in and vanished
+            from, most churned first
+        """
+        table = [
+            [path, appeared, vanished]
+            for path, (appeared, vanished) in self.root_files.items()
+        ]
+        table.sort(key=lambda row: (-row[1] - row[2], row[0]))
+        return table[:top]
+
+
+class GithubCli(object):
+    """
+    Client mining orgs and repos through PyGithub.
+
+    Args:
+        csv_file (String, optional): CSV output. Defaults to None.
+        json_file (String, optional): JSONL output. Defaults to None.
+        parquet_file (String, optional): Parquet output. Defaults to None.
+        db_file (String, optional): SQLite inventory. Defaults to None.
+        workers (Integer, optional): Repos fetched concurrently. Defaults to 1.
+        engine (String, optional): rest, graphql or async. Defaults to "rest".
+        cache_dir (String, optional): HTTP cache directory, None disables it. Defaults to None.
+        cache_size (Integer, optional): Size cap of the HTTP cache in MB. Defaults to 512.
+        state_file (String, optional): Incremental state file. Defaults to None.
+        profile (Boolean, optional): Count requests per phase. Defaults to None.
+        log_format (String, optional): tree, jsonl or quiet. Defaults to "tree".
+        language_views (list, optional): Language tables of print_details. Defaults to ["core"].
+        shard (Tuple, optional): Shard number and shard count of --all. Defaults to None.
+        shard_by (String, optional): hash or size. Defaults to "hash".
+        tree_filter (TreeFilter, optional): Tree files listed per repo. Defaults to None.
+        skip_forks (Boolean, optional): Leave forks out of the listings. Defaults to False.
+        skip_archived (Boolean, optional): Leave archived repos out of the listings. Defaults to False.
+        pushed_since (datetime, optional): Leave repos pushed before out of the listings. Defaults to None.
+    """
+
+    def __init__(
+        self,
+        repo: str = None,
+        org: str = None,
+        csv_file=None,
+        json_file=None,
+        parquet_file=None,
+        db_file=None,
+        workers=1,
+        engine="rest",
+        cache_dir=None,
+        cache_size=512,
+        state_file=None,
+        profile=None,
+        log_format="tree",
+        language_views=("core",),
+        shard=None,
+        shard_by="hash",
+        tree_filter=None,
+        skip_forks=False,
+        skip_archived=False,
+        pushed_since=None,
+    ):
+        self.client = None
+        self.orgs = None
+        self.org_name = None
+        self.org = None
+        self.repo = None
+        self.repo_name = None
+        self.repos = None
+        self.languages = None
+        self.contents = None
+        self.language_table = None
+        self.org_count = 0
+        self.repo_count = 0
+        self.language_dict = {}
+        self.identified_languages = set()
+        self.language_stats = LanguageStats()
+        # Changes between two snapshots, filled by diff_snapshots
+        self.snapshot_diff = None
+        self.language_views = language_views
+        self.csv_file = csv_file
+        self.json_file = json_file
+        self.parquet_file = parquet_file
+        self.db_file = db_file
+        self.workers = max(workers, 1)
+        self.engine = engine
+        self.cache_dir = cache_dir
+        self.cache_size = cache_size
+        self.state_file = state_file
+        self.state = {}
+        self.state_orgs = set()
+        self.state_seen = set()
+        self.reused_count = 0
+        self.remined_count = 0
+        self.checkpoint_file = None
+        self.resumed = {}
+        self.executor = None
+        self.done_orgs = set()
+        # Next listing page of the orgs started but not done, by --all
+        self.org_pages = {}
+        self.graphql_url = None
+        self.limiter = None
+        self.cache = None
+        self.profile = profile
+        self.log_format = log_format
+        self.profiler = None
+        self.shard = shard
+        self.shard_by = shard_by
+        self.shard_orgs = None
+        self.tree_filter = tree_filter
+        self.skip_forks = skip_forks
+        self.skip_archived = skip_archived
+        self.pushed_since = pushed_since
+        self.skipped_count = 0
+        self.languages_skipped = 0
+        self.strings = StringPool()
+        self.lock = threading.Lock()
+        self.sinks = []
+        self.stopped = False
+
+    def connect(self, url, token: str, tokens=None):
+        from github import Github
+        from github.Requester import Requester
+
+        # Thread-safe connections sharing one keep-alive pool sized for workers
+        SessionConnection.configure(self.workers)
+        self.limiter = SessionConnection.limiter = self.create_limiter(token, tokens)
+        self.cache = SessionConnection.cache = self.create_cache()
+        self.profiler = SessionConnection.profiler = self.create_profiler()
+        Requester.injectConnectionClasses(HTTPSessionConnection, SessionConnection)
+        self.client = Github(
+            base_url=f"{self.root_url(url)}/api/v3",
+            login_or_token=f"{token}",
+            pool_size=self.workers,
+            per_page=100,
+        )
+        self.graphql_url = f"{self.root_url(url)}/api/graphql"
+
+    def close(self):
+        """
+        Closes the keep-alive connections shared by the workers
+        """
+        if SessionConnection.session:
+            SessionConnection.session.close()
+            SessionConnection.session = None
+
+    def root_url(self, url):
+        # A hostname may carry its scheme, like http://127.0.0.1:8000 for the
+        # fake GHE server of scripts/
+        return url if "://" in url else f"https://{url}"
+
+    def create_limiter(self, token, tokens=None):
+        pool = [t for t in dict.fromkeys([token] + list(tokens or [])) if t]
+        return RateLimiter(pool if pool else [token])
+
+    def create_cache(self):
+        if not self.cache_dir:
+            return None
+        return ResponseCache(self.cache_dir, self.cache_size * 1024 * 1024)
+
+    def create_profiler(self):
+        return Profiler() if self.profile else None
+
+    def get_all_organizations(self):
+        return self.client.get_organizations()
+
+    def get_organization(self, org_name):
+        return self.client.get_organization(org_name)
+
+    def get_all_repos(self):
+        return self.client.get_repos(self.organization)
+
+    def get_repo(self, repo_name):
+        return self.listed_repo(
+            self.request_json(f"/repos/{self.org.login}/{repo_name}")
+        )
+
+    def get_file_contents(self):
+        return self.get_root_contents(self.repo)
+
+    def get_languages(self):
+        return self.get_repo_languages(self.repo)
+
+    def request_json(self, url, parameters=None):
+        """
+        GETs an API URL through the PyGithub requester, without building
+        PyGithub objects out of the answer
+
+        Args:
+            url (String): Absolute URL, or path relative to the API root
+            parameters (dict, optional): Query parameters. Defaults to None.
+
+        Raises:
+            GithubException: If the API answers with an error status
+
+        Returns:
+            Decoded JSON answer
+        """
+        # PyGithub 1.55 has no public accessor for its requester
+        requester = self.client._Github__requester
+        _, data = requester.requestJsonAndCheck("GET", url, parameters=parameters)
+        return data
+
+    def listed_repo(self, data):
+        return ListedRepo(data, self.strings)
+
+    def pooled_languages(self, languages):
+        return {self.strings(name): size for name, size in languages.items()}
+
+    def root_contents(self, paths):
+        return tuple(self.strings(RootContent(path)) for path in paths)
+
+    def get_repo_languages(self, repo):
+        """
+        Returns:
+            dict: Languages of a repo and their byte sizes, largest first
+        """
+        return self.pooled_languages(
+            self.request_json(f"/repos/{repo.full_name}/languages")
+        )
+
+    def get_root_contents(self, repo):
+        """
+        Raises:
+            GithubException: If the repo is empty
+
+        Returns:
+            Tuple: Root content files of a repo
+        """
+        data = self.request_json(f"/repos/{repo.full_name}/contents/")
+        return self.root_contents(content["path"] for content in data)
+
+    def calculate_sum(self, dict):
+        """
+        Calculates the sum of the values of a dict
+
+        Args:
+            dict (dict): Calculates the sum of the values of languages_dict
+
+        Returns:
+            Int: sum of the values
+        """
+        values = dict.values()
+        return sum(values)
+
+    def percentage(self, count, total_count):
+        """
+        Calculates percentage given a count and total count
+
+        Args:
+            count (Integer): # of times language appeared as core language
+            total_count (Integer): total count of languages
+
+        Returns:
+            String: Returns the percentage rounded to one decimal
+        """
+        percentage = 100 * float(count) / float(total_count)
+        return f"{percentage:.1f}%"
+
+    def create_table_list(self, dictionary):
+        """
+        Creates a table list to display results using tabulate
+
+        Args:
+            dict (dict): language dictionary
+
+        Returns:
+            List: A Nested list of languages, count and percentage
+        """
+        total_count = self.calculate_sum(dictionary)
+        language_table = []
+        for language, count in dictionary.items():
+            if not language:
+                language = "Empty"
+            percentage = self.percentage(count, total_count=total_count)
+            temp_list = [language, count, percentage]
+            language_table.append(temp_list)
+        # Ties by name, so the table doesn't depend on the order repos were mined in
+        language_table.sort(key=lambda row: (-row[1], row[0]))
+        return language_table
+
+    def load_checkpoint(self, checkpoint_file):
+        """
+        Restores the progress of an interrupted --all crawl: completed orgs,
+        the listing page to continue from, counts and output file offsets
+
+        Args:
+            checkpoint_file (String): Checkpoint written by save_checkpoint
+        """
+        with open(checkpoint_file, "r") as f:
+            self.resumed = json.load(f)
+        self.done_orgs = set(self.resumed["done_orgs"])
+        self.org_pages = dict(self.resumed["org_pages"])
+        self.merge_counts(
+            dict(self.resumed["language_dict"]),
+            org_count=self.resumed["org_count"],
+            repo_count=self.resumed["repo_count"],
+        )
+        self.language_stats.load(self.resumed["language_stats"])
+        log.info(
+            f"[.] Resuming from {checkpoint_file}: {len(self.done_orgs)} orgs and {self.repo_count} repos done"
+        )
+
+    def resume_page(self, org_login):
+        """
+        Returns:
+            Integer: Listing page to start an org at, 0 unless it was interrupted
+            or failed
+        """
+        return self.org_pages.get(org_login, 0)
+
+    def save_checkpoint(self, org_login=None, page=None):
+        """
+        Records the progress of an --all crawl, after each org and after each
+        listing page of an org in progress. Orgs that failed keep the page
+        they got to, so --resume retries them from there. Written atomically
+        so a crash never leaves a partial checkpoint.
+
+        Args:
+            org_login (String, optional): Org in progress. Defaults to None.
+            page (Integer, optional): Next listing page of that org. Defaults to None.
+        """
+        if not self.checkpoint_file:
+            return
+        with self.lock:
+            if org_login is not None:
+                self.org_pages[org_login] = page
+            checkpoint = {
+                "done_orgs": sorted(self.done_orgs),
+                "org_pages": dict(self.org_pages),
+                "language_dict": [[k, v] for k, v in self.language_dict.items()],
+                "language_stats": self.language_stats.state(),
+                "org_count": self.org_count,
+                "repo_count": self.repo_count,
+                "sinks": {sink.path: sink.offset() for sink in self.sinks},
+                "shard_orgs": self.shard_orgs,
+            }
+        with open(self.checkpoint_file + ".tmp", "w") as f:
+            json.dump(checkpoint, f)
+        os.replace(self.checkpoint_file + ".tmp", self.checkpoint_file)
+
+    def finish_checkpoint_org(self, org_login):
+        # Only called once the org is reported, a failed org is left to --resume
+        with self.lock:
+            self.done_orgs.add(org_login)
+            self.org_pages.pop(org_login, None)
+        self.save_checkpoint()
+
+    def remove_checkpoint(self):
+        """
+        Deletes the checkpoint of a crawl that mined every org. It is kept if
+        an org failed, to retry it with --resume, and for --shard runs, whose
+        checkpoints --merge counts orgs from.
+        """
+        if not self.checkpoint_file:
+            return
+        failed = [org.login for org in self.orgs if org.login not in self.done_orgs]
+        if failed:
+            log.error(
+                f"[!] {len(failed)} orgs failed, retry them with --resume {self.checkpoint_file}"
+            )
+        elif not self.shard:
+            os.remove(self.checkpoint_file)
+
+    def get_org_size(self, org):
+        return org.public_repos + (getattr(org, "total_private_repos", None) or 0)
+
+    def select_shard(self, g):
+        """
+        Keeps the orgs of g.orgs that belong to this node's --shard. A resumed
+        crawl keeps the orgs recorded in its checkpoint, as repo counts may
+        have changed since.
+
+        Args:
+            g (github client): Instantiated Github client
+        """
+        index, count = self.shard
+        orgs = list(g.orgs)
+        if self.resumed.get("shard_orgs") is not None:
+            keep = set(self.resumed["shard_orgs"])
+        elif self.shard_by == "size":
+            # Org listings don't carry repo counts, each org is fetched once
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                sizes = dict(
+                    zip(
+                        [org.login for org in orgs],
+                        executor.map(self.get_org_size, orgs),
+                    )
+                )
+            shards = balance_shards(sizes, count)
+            keep = {login for login in shards if shards[login] == index}
+        else:
+            keep = {org.login for org in orgs if shard_of(org.login, count) == index}
+        g.orgs = [org for org in orgs if org.login in keep]
+        self.shard_orgs = sorted(keep)
+        log.info(f"[.] Shard {index}/{count}: {len(g.orgs)} of {len(orgs)} orgs")
+
+    def merge_shards(self, g, shard_files):
+        """
+        Merges the outputs of --shard runs into the -c/-j outputs, counting
+        them like a single run would. Checkpoints of the shards add the orgs
+        without any repos to the org count.
+
+        Args:
+            g (github client): Instantiated Github client
+            shard_files (list): CSV/JSONL outputs and checkpoints of the shards
+        """
+        orgs = set()
+        seen = set()
+        for shard_file in shard_files:
+            with open(shard_file, "r", newline="") as f:
+                first = f.readline()
+                f.seek(0)
+                if first.startswith("{") and "done_orgs" in json.loads(first):
+                    orgs.update(json.load(f)["done_orgs"])
+                    continue
+                if first.startswith("{"):
+                    rows = (json.loads(line) for line in f if line.strip())
+                else:
+                    rows = (self.parse_csv_row(row) for row in csv.DictReader(f))
+                for row in rows:
+                    if (row["org"], row["repo_name"]) in seen:
+                        continue
+                    seen.add((row["org"], row["repo_name"]))
+                    orgs.add(row["org"])
+                    self.merge_counts(
+                        {row["repo_lang"]: 1},
+                        repo_count=1,
+                        org_login=row["org"],
+                        languages=dict.fromkeys(row["repo_langs"]),
+                    )
+                    for sink in self.sinks:
+                        sink.write(row)
+        self.merge_counts({}, org_count=len(orgs))
+        log.info(f"[.] Merged {len(shard_files)} shard files")
+
+    def parse_csv_row(self, row):
+        # CsvSink writes None as "" and lists as their repr
+        for key in ("org_owner", "repo_lang"):
+            row[key] = row[key] or None
+        for key in ("repo_langs", "repo_tld"):
+            row[key] = ast.literal_eval(row[key])
+        if row.get("repo_tree"):
+            row["repo_tree"] = ast.literal_eval(row["repo_tree"])
+        return row
+
+    def load_state(self):
+        """
+        Loads the incremental state file: org/repo -> last seen pushed_at,
+        languages, root content files and contents error of each repo
+        """
+        if os.path.isfile(self.state_file):
+            with open(self.state_file, "r") as f:
+                self.state = json.load(f)
+            # Held for the whole run, share the strings repeated across repos
+            for previous in self.state.values():
+                previous["languages"] = self.pooled_languages(previous["languages"])
+                previous["repo_tld"] = [self.strings(x) for x in previous["repo_tld"]]
+            log.info(
+                f"[.] Incremental: loaded {len(self.state)} repos from {self.state_file}"
+            )
+
+    def save_state(self):
+        """
+        Writes the incremental state file. Repos of the orgs whose whole
+        listing was mined in this run that weren't seen anymore are dropped,
+        other orgs are left untouched.
+        """
+        state = {
+            key: value
+            for key, value in self.state.items()
+            if key in self.state_seen or key.split("/")[0] not in self.state_orgs
+        }
+        with open(self.state_file + ".tmp", "w") as f:
+            json.dump(state, f)
+        os.replace(self.state_file + ".tmp", self.state_file)
+        log.info(
+            f"[*] Incremental: {self.reused_count} unchanged repos reused, {self.remined_count} re-mined"
+        )
+
+    def plan_repo(self, repo):
+        """
+        Plans the requests of a repo from the metadata of the repo listing, so
+        repos that are filtered out cost no request, and repos without code no
+        languages request
+
+        Args:
+            repo (Repository): Repository returned by the repo listing
+
+        Returns:
+            String: "skip" for a repo left out by --skip-forks, --skip-archived
+            or --pushed-since, "no_languages" for a repo of 0 KB without a
+            core language, whose languages needn't be requested but which still
+            costs its root contents request, else "fetch"
+        """
+        if self.skip_forks and repo.fork:
+            return "skip"
+        if self.skip_archived and repo.archived:
+            return "skip"
+        if self.pushed_since and (
+            not repo.pushed_at or repo.pushed_at < self.pushed_since
+        ):
+            return "skip"
+        # Only the languages request is saved: such a repo may still have
+        # files, none in a detected language, and GHE updates the size some
+        # time after a push, so a 0 KB repo still costs one root contents
+        # request (and its tree with --full-tree) for its repo_tld
+        if repo.size == 0 and repo.language is None:
+            return "no_languages"
+        return "fetch"
+
+    def plan_repos(self, repos):
+        """
+        Returns:
+            List: Repos of a listing page that aren't left out by the filters
+        """
+        planned = [repo for repo in repos if self.plan_repo(repo) != "skip"]
+        with self.lock:
+            self.skipped_count += len(repos) - len(planned)
+            if self.state_file:
+                # Filtered out repos still exist, their state is kept
+                self.state_seen.update(
+                    f"{repo.owner.login}/{repo.name}" for repo in repos
+                )
+        return planned
+
+    def fetch_repo(self, repo):
+        """
+        Fetches the languages and root content files of a repository.
+        Runs on the worker threads, so it only touches the repo it is given.
+
+        In incremental mode, a repo whose pushed_at didn't change since the
+        last run is rebuilt from the state file.
+
+        Args:
+            repo (Repository): Repository returned by the repo listing
+
+        Returns:
+            Tuple: (languages dict, root content files, error message or None,
+            tree files or None)
+        """
+        if self.stopped:
+            # mine() was closed early, skip the repos still queued
+            raise MiningStopped()
+        reused = self.reuse_repo(repo)
+        if reused:
+            return reused
+
+        from github import GithubException
+
+        if self.plan_repo(repo) == "no_languages":
+            languages = self.skip_languages()
+        else:
+            languages = self.get_repo_languages(repo)
+        error = None
+        try:
+            contents = self.get_root_contents(repo)
+        except GithubException as e:
+            contents, error = [], e.args[1]["message"]
+        tree = self.get_tree(repo) if self.tree_filter else None
+
+        self.remember_repo(repo, languages, contents, error, tree)
+        return languages, contents, error, tree
+
+    def fetch_batch(self, repos):
+        """
+        Returns:
+            List: fetch_repo results of a work unit of repos
+        """
+        return [self.fetch_repo(repo) for repo in repos]
+
+    def skip_languages(self):
+        """
+        Returns:
+            dict: Languages of a repo planned as "no_languages", without a
+            request
+        """
+        with self.lock:
+            self.languages_skipped += 1
+        return {}
+
+    def get_tree(self, repo):
+        """
+        Lists the files of a repo's default branch kept by self.tree_filter,
+        see TreeFilter.walk
+
+        Args:
+            repo (Repository): Repository returned by the repo listing
+
+        Returns:
+            List: Paths of the kept files, empty for an empty repo
+        """
+        from github import GithubException
+
+        # PyGithub's GitTree would build an object for every entry of the tree
+        walk = self.tree_filter.walk(repo.default_branch)
+        try:
+            request = next(walk)
+            while True:
+                sha, recursive = request
+                listing = self.request_json(
+                    f"/repos/{repo.full_name}/git/trees/{quote(sha, safe='')}",
+                    {"recursive": 1} if recursive else None,
+                )
+                request = walk.send(listing)
+        except StopIteration as stop:
+            return stop.value
+        except GithubException as e:
+            # 409 for an empty repo, 404 for a default branch that is gone
+            if e.status in (404, 409):
+                return []
+            raise
+
+    def reuse_repo(self, repo):
+        """
+        In incremental mode, rebuilds a repo whose pushed_at didn't change
+        since the last run from the state file
+
+        Args:
+            repo (Repository): Repository returned by the repo listing
+
+        Returns:
+            Tuple: (languages dict, root content files, error message, tree
+            files or None), None if the repo has to be fetched
+        """
+        if not self.state_file:
+            return None
+        key = f"{repo.owner.login}/{repo.name}"
+        pushed_at = repo.pushed_at.isoformat() if repo.pushed_at else None
+        with self.lock:
+            self.state_seen.add(key)
+            previous = self.state.get(key)
+            tree_key = self.tree_filter.key() if self.tree_filter else None
+            if (
+                previous
+                and previous["pushed_at"] == pushed_at
+                and previous.get("tree_filter") == tree_key
+            ):
+                self.reused_count += 1
+                return (
+                    previous["languages"],
+                    self.root_contents(previous["repo_tld"]),
+                    previous["error"],
+                    previous.get("repo_tree"),
+                )
+        return None
+
+    def remember_repo(self, repo, languages, contents, error, tree=None):
+        """
+        In incremental mode, records a fetched repo in the state file
+        """
+        if not self.state_file:
+            return
+        with self.lock:
+            self.remined_count += 1
+            self.state[f"{repo.owner.login}/{repo.name}"] = {
+                "pushed_at": repo.pushed_at.isoformat() if repo.pushed_at else None,
+                "languages": languages,
+                "repo_tld": [x.path for x in contents],
+                "error": error,
+                "repo_tree": tree,
+                "tree_filter": self.tree_filter.key() if self.tree_filter else None,
+            }
+
+    def fetch_repos(self, repos):
+        """
+        Fetches up to self.workers repos at once and yields them back in
+        listing order, so the printed tree stays deterministic.
+
+        Args:
+            repos (iterable): Repositories returned by the repo listing
+
+        Yields:
+            Tuple: (repo, languages dict, root content files, error message,
+            tree files)
+        """
+        if self.workers <= 1:
+            for repo in repos:
+                yield (repo,) + self.fetch_repo(repo)
+            return
+
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for repo in repos:
+                pending.append((repo, executor.submit(self.fetch_repo, repo)))
+                # Keep the window bounded so a huge org isn't held in memory
+                if len(pending) >= self.workers * 2:
+                    repo, future = pending.popleft()
+                    yield (repo,) + future.result()
+            while pending:
+                repo, future = pending.popleft()
+                yield (repo,) + future.result()
+
+    def merge_counts(
+        self, language_counts, org_count=0, repo_count=0, org_login=None, languages=None
+    ):
+        """
+        Merges counts into language_dict, org_count, repo_count and the
+        language stats while holding the client lock, so it can be called from
+        any thread
+
+        Args:
+            language_counts (dict): Core language -> # of repos to add
+            org_count (Integer, optional): # of orgs to add. Defaults to 0.
+            repo_count (Integer, optional): # of repos to add. Defaults to 0.
+            org_login (String, optional): Org of a repo to add to the stats. Defaults to None.
+            languages (dict, optional): Languages of that repo and their byte sizes. Defaults to None.
+        """
+        with self.lock:
+            if languages is not None:
+                self.language_stats.add(org_login, languages)
+            for language, count in language_counts.items():
+                if language not in self.identified_languages:
+                    self.identified_languages.add(language)
+                    self.language_dict[language] = count
+                else:
+                    self.language_dict[language] += count
+            self.org_count += org_count
+            self.repo_count += repo_count
+
+    def finish_org(self, g, listed=True):
+        """
+        Args:
+            g (github client): Instantiated Github client
+            listed (Boolean, optional): False if only some repos of the org
+                were mined, like with --repo. Defaults to True.
+        """
+        if g.log_format == "tree":
+            log.info(
+                f'{colored(f"[&] Total # of repos:", color="yellow")} {colored(str(g.repo_count), attrs=["underline", "bold"])}'
+            )
+        g.merge_counts({}, org_count=1)
+        # The state of an org is only pruned once all of its listing was seen,
+        # not for an org resumed from a later page
+        if listed and not g.resumed.get("org_pages", {}).get(g.org.login):
+            with g.lock:
+                g.state_orgs.add(g.org.login)
+
+    def log_org(self, g):
+        if g.log_format == "tree":
+            log.info(LazyMessage(render_org, g.org.login, g.org.email, g.org.html_url))
+        elif g.log_format == "jsonl":
+            log.info(
+                LazyMessage(
+                    json.dumps,
+                    {
+                        "event": "org",
+                        "org": g.org.login,
+                        "owner": g.org.email,
+                        "url": g.org.html_url,
+                    },
+                )
+            )
+
+    def report_repo(self, g, repo, languages, contents, error=None, tree=None):
+        """
+        Logs a fetched repository, counts its core language and appends its row
+        to the outputs
+
+        Args:
+            g (github client): Instantiated Github client
+            repo (Repository): Repository that was fetched
+            languages (dict): Languages of the repo and their byte sizes
+            contents (list): Root content files of the repo
+            error (String, optional): Message of a failed contents request
+            tree (list, optional): Tree files matching the --full-tree filter
+        """
+        g.repo = repo
+        g.languages = languages
+        g.contents = contents
+        g.merge_counts(
+            {g.repo.language: 1},
+            repo_count=1,
+            org_login=g.org.login,
+            languages=g.languages,
+        )
+        # One record per repo, rendered on the log listener thread
+        if g.log_format == "tree":
+            log.info(
+                LazyMessage(
+                    render_repo,
+                    g.repo.name,
+                    g.repo.language,
+                    g.languages,
+                    g.contents,
+                    error,
+                    tree,
+                )
+            )
+        elif g.log_format == "jsonl":
+            log.info(
+                LazyMessage(
+                    render_repo_event,
+                    g.org.login,
+                    g.repo.name,
+                    g.repo.language,
+                    g.languages,
+                    g.contents,
+                    error,
+                    tree,
+                )
+            )
+
+        _repo = {
+            "org": g.org.login,
+            "org_owner": g.org.email,
+            "org_url": g.org.html_url,
+            "repo_name": g.repo.name,
+            "repo_lang": g.repo.language,
+            "repo_langs": [x for x in g.languages],
+            "repo_tld": [x.path for x in g.contents],
+        }
+        if tree is not None:
+            _repo["repo_tree"] = tree
+
+        for sink in self.sinks:
+            sink.write(_repo, g.languages)
+
+    def graphql(self, query, variables):
+        """
+        Runs a query against the GHE GraphQL endpoint. It goes through the
+        PyGithub requester so it shares its connection pool and error handling.
+
+        Args:
+            query (String): GraphQL query
+            variables (dict): Variables of the query
+
+        Raises:
+            GithubException: If the request fails or the query returns errors
+
+        Returns:
+            dict: The "data" member of the response
+        """
+        from github import GithubException
+
+        # PyGithub 1.55 has no public accessor for its requester
+        requester = self.client._Github__requester
+        headers, data = requester.requestJsonAndCheck(
+            "POST",
+            self.graphql_url,
+            input={"query": query, "variables": variables},
+        )
+        if data.get("errors"):
+            raise GithubException(200, data["errors"][0], headers)
+        return data["data"]
+
+    def get_repo_pages_graphql(self, org_login):
+        """
+        Pages through the repositories of an org with GraphQL, fetching the
+        languages and root tree entries of a whole page in one request
+
+        Args:
+            org_login (String): Login of the organization
+
+        Yields:
+            dict: The "organization" member of each page
+        """
+        cursor = None
+        while True:
+            data = self.graphql(
+                GRAPHQL_REPOS_QUERY,
+                {"org": org_login, "pageSize": GRAPHQL_PAGE_SIZE, "cursor": cursor},
+            )
+            organization = data["organization"]
+            yield organization
+            page_info = organization["repositories"]["pageInfo"]
+            if not page_info["hasNextPage"]:
+                return
+            cursor = page_info["endCursor"]
+
+    def fetch_org_graphql(self, org_login):
+        """
+        Fetches every repository of an org with batched GraphQL queries
+
+        Args:
+            org_login (String): Login of the organization
+
+        Returns:
+            Tuple: (GraphqlOrg, list of (repo, languages, contents, error, tree))
+        """
+        org = None
+        results = []
+        for organization in self.get_repo_pages_graphql(org_login):
+            # The query already carries the org details, no lazy completion
+            org = GraphqlOrg(
+                organization["login"], organization["email"], organization["url"]
+            )
+            for node in organization["repositories"]["nodes"]:
+                primary_language = (node["primaryLanguage"] or {}).get("name")
+                repo = GraphqlRepo(node["name"], self.strings(primary_language))
+                listed = JsonObject(
+                    {
+                        "owner": {"login": org_login},
+                        "name": node["name"],
+                        "size": node["diskUsage"],
+                        "fork": node["isFork"],
+                        "archived": node["isArchived"],
+                        "pushed_at": node["pushedAt"],
+                        "language": repo.language,
+                    }
+                )
+                if not self.plan_repos([listed]):
+                    continue
+                languages = {
+                    self.strings(edge["node"]["name"]): edge["size"]
+                    for edge in node["languages"]["edges"]
+                }
+                tree = node["object"] or {}
+                contents = self.root_contents(
+                    entry["name"] for entry in tree.get("entries", [])
+                )
+                results.append((repo, languages, contents, None, None))
+        return org, results
+
+    def get_repo_details_graphql(self, g):
+        """
+        Same as get_repo_details, but built from batched GraphQL queries
+        instead of 2 REST calls per repo
+
+        Args:
+            g (github client): Instantiated Github client
+        """
+        g.org, results = g.fetch_org_graphql(g.org.login)
+        g.log_org(g)
+        for result in results:
+            g.report_repo(g, *result)
+        g.finish_org(g)
+
+    def get_repo_details(self, g):
+        """
+        Gets all repository detailes including Org Name, Owner, Url, and Repositories and the following data:
+        - Repo Name
+        - Core Language
+        - All languages in the repo
+        - Root content files
+
+        Args:
+            g (github client): Instantiated Github client
+        """
+        if g.engine == "graphql":
+            return g.get_repo_details_graphql(g)
+
+        g.log_org(g)
+        for page, repos in g.get_repo_pages(g.org, g.resume_page(g.org.login)):
+            # A page is reported once all its repos are fetched, so one that
+            # fails leaves no rows for --resume to write again
+            results = list(g.fetch_repos(g.plan_repos(repos)))
+            for result in results:
+                g.report_repo(g, *result)
+            g.save_checkpoint(g.org.login, page + 1)
+
+        g.finish_org(g)
+
+    def get_repo_pages(self, org, start_page=0):
+        """
+        Pages through the repo listing of an org, so a crawl can checkpoint
+        after each page and resume from it
+
+        Args:
+            org (Organization): Organization to list
+            start_page (Integer, optional): First page to fetch. Defaults to 0.
+
+        Yields:
+            Tuple: (page number, list of ListedRepo)
+        """
+        page = start_page
+        while True:
+            data = self.request_json(
+                f"/orgs/{org.login}/repos",
+                {"per_page": self.client.per_page, "page": page + 1},
+            )
+            repos = [self.listed_repo(repo) for repo in data]
+            if repos:
+                yield page, repos
+            if len(repos) < self.client.per_page:
+                return
+            page += 1
+
+    def list_org_repos(self, org):
+        """
+        Lists the repositories of an org. Runs on the worker threads.
+
+        Args:
+            org (Organization): Organization returned by the org listing
+
+        Returns:
+            List: Repositories of the org
+        """
+        repos = [
+            repo
+            for page, repos in self.get_repo_pages(org, self.resume_page(org.login))
+            for repo in self.plan_repos(repos)
+        ]
+        # Complete the org here so reporting it doesn't block on a request
+        org.email
+        return repos
+
+    def submit(self, fn, *args):
+        """
+        Schedules fn(*args) on the worker pool of get_all_repo_details
+
+        Returns:
+            Future: Result of the call
+        """
+        return self.executor.submit(fn, *args)
+
+    def submit_window(self, fn, units, window):
+        """
+        Schedules fn on the worker pool for each unit, submitting the next unit
+        as soon as one of the window in flight completes, and yields the
+        completed units back in order. At most window completed units wait on
+        an earlier one still running, so a slow unit only stalls the pool once
+        that reorder buffer is full, and results don't pile up ahead of the
+        reporting.
+
+        Args:
+            fn (callable): Function or coroutine function run for each unit
+            units (iterable): (key, args) of each call, read lazily
+            window (Integer): Calls in flight, and completed calls held, at most
+
+        Yields:
+            Tuple: (key, completed Future of fn(*args))
+        """
+        units = iter(units)
+        # Units in order, running or completed, and those still running
+        pending, running = deque(), set()
+        while True:
+            running = {future for future in running if not future.done()}
+            while len(running) < window and len(pending) - len(running) < window:
+                unit = next(units, None)
+                if unit is None:
+                    break
+                key, args = unit
+                future = self.submit(fn, *args)
+                pending.append((key, future))
+                running.add(future)
+            if not pending:
+                return
+            if not pending[0][1].done():
+                wait(running, return_when=FIRST_COMPLETED)
+            while pending and pending[0][1].done():
+                yield pending.popleft()
+
+    def list_org_units(self, g, orgs):
+        """
+        Lists the orgs, up to g.workers of them ahead of the one being queued,
+        and splits their repos into work units of REPO_BATCH repos
+
+        Args:
+            g (github client): Instantiated Github client
+            orgs (list): Orgs to mine
+
+        Yields:
+            Tuple: ((org, repos of the unit, True for the org's last unit),
+            (repos,)), an org without repos gets one empty unit
+        """
+        listings = g.submit_window(
+            g.list_org_repos, ((org, (org,)) for org in orgs), g.workers
+        )
+        for org, listing in listings:
+            try:
+                repos = listing.result()
+            except Exception as e:
+                log.error(f"[!] Could not iterate because of: {e}")
+                continue
+            starts = range(0, len(repos), REPO_BATCH) or [0]
+            for start in starts:
+                batch = repos[start : start + REPO_BATCH]
+                yield (org, batch, start == starts[-1]), (batch,)
+
+    def get_all_repo_details(self, g):
+        """
+        Gets the repository details of every org in g.orgs, mining several orgs
+        at once on one pool of g.workers threads.
+
+        Orgs are listed a few ahead of the one being mined and their repos are
+        queued in work units of REPO_BATCH repos, at most UNITS_PER_WORKER per
+        worker in flight, the next unit queued as soon as one completes. Idle
+        workers keep pulling the repos of the next orgs instead of waiting
+        behind the last repos of a giant one, and only the orgs in that window
+        are held in memory. Each org is reported in listing order as soon as
+        all its repos are fetched.
+
+        Orgs aren't queued largest first: that needs the listing of every org
+        before the first repo is mined, all of them held in memory. A giant org
+        is spread over the whole pool in units all the same.
+
+        Args:
+            g (github client): Instantiated Github client
+        """
+        orgs = [org for org in g.orgs if org.login not in g.done_orgs]
+        with ThreadPoolExecutor(max_workers=g.workers) as executor:
+            g.executor = executor
+            if g.engine == "graphql":
+                # An org's GraphQL pages are chained by cursor, so the org is the unit
+                units = ((org.login, (org.login,)) for org in orgs)
+                for login, future in g.submit_window(
+                    g.fetch_org_graphql, units, g.workers * UNITS_PER_WORKER
+                ):
+                    try:
+                        g.org, results = future.result()
+                        g.log_org(g)
+                        for result in results:
+                            g.report_repo(g, *result)
+                        g.finish_org(g)
+                        g.finish_checkpoint_org(login)
+                    except Exception as e:
+                        log.error(f"[!] Could not iterate because of: {e}")
+                return
+
+            fetched = g.submit_window(
+                g.fetch_batch, g.list_org_units(g, orgs), g.workers * UNITS_PER_WORKER
+            )
+            results, error = [], None
+            for (org, repos, last), future in fetched:
+                try:
+                    results.extend(zip(repos, future.result()))
+                except Exception as e:
+                    error = error or e
+                if not last:
+                    continue
+                # Nothing of an org is reported unless all its repos were
+                # fetched, so --resume can retry a failed one from scratch
+                org_results, results, org_error, error = results, [], error, None
+                if org_error:
+                    log.error(f"[!] Could not iterate because of: {org_error}")
+                    continue
+                g.org = org
+                try:
+                    g.log_org(g)
+                    for repo, result in org_results:
+                        g.report_repo(g, repo, *result)
+                    g.finish_org(g)
+                    g.finish_checkpoint_org(org.login)
+                except Exception as e:
+                    log.error(f"[!] Could not iterate because of: {e}")
+
+    def get_single_repo_details(self, g):
+        """
+        Gets details for a single repository including Org Name, Owner, Url, and repo with the following data:
+        - Repo Name
+        - Core Language
+        - All languages in the repo
+        - Root content files
+
+        Args:
+            g (github client): Instantiated Github client
+        """
+        g.log_org(g)
+        g.report_repo(g, *next(g.fetch_repos([g.repo])))
+        g.finish_org(g, listed=False)
+
+    def get_all_orgs_details(self, g):
+        """
+        Gets the repository details of every org of the instance, or of this
+        node's --shard of them
+
+        Args:
+            g (github client): Instantiated Github client
+        """
+        # Get all organizations in Github
+        g.orgs = g.get_all_organizations()
+        if g.shard:
+            g.select_shard(g)
+        if g.workers > 1:
+            # Mine several orgs at once, sharing the workers across all of them
+            g.get_all_repo_details(g)
+            return
+        # For each org, we will get different data points that will be useful
+        for org in g.orgs:
+            if org.login in g.done_orgs:
+                continue
+            g.org = org
+            try:
+                g.get_repo_details(g)
+            except Exception as e:
+                log.error(f"[!] Could not iterate because of: {e}")
+                continue
+            g.finish_checkpoint_org(org.login)
+
+    def print_details(self, g):
+        """
+        Function used to print all data gathered results.
+        Prints out the total # of repos, orgs and provide a table of collected data
+
+        Args:
+            g (github client): Instantiated Github client
+        """
+        from tabulate import tabulate
+
+        log.info(f"\n**************************************")
+        log.info(f"[*] Grand Total number of Orgs: {g.org_count}")
+        log.info(f"[*] Grand Total number of Repos: {g.repo_count}")
+        log.info(f"**************************************")
+        if g.skipped_count or g.languages_skipped:
+            log.info(
+                f"[*] Planner: {g.skipped_count} repos filtered out, {g.languages_skipped} languages requests saved on repos without code"
+            )
+        g.language_table = self.create_table_list(g.language_dict)
+        if "core" in g.language_views:
+            log.info(
+                tabulate(g.language_table, headers=["Language", "Count", "Percentage"])
+            )
+        if "bytes" in g.language_views:
+            log.info("")
+            log.info(
+                tabulate(
+                    g.language_stats.table(),
+                    headers=["Language", "Repos", "Bytes", "Share", "Median bytes"],
+                )
+            )
+        if "orgs" in g.language_views:
+            log.info("")
+            log.info(
+                tabulate(
+                    g.language_stats.org_table(),
+                    headers=["Org", "Repos", "Bytes", "Top languages"],
+                )
+            )
+        limiter = g.limiter
+        if limiter:
+            for line in limiter.summary():
+                log.info(f"[*] Rate limit: {line}")
+            log.info(f"[*] Rate limit: {limiter.waited:.1f} seconds spent waiting")
+        cache = g.cache
+        if cache:
+            log.info(
+                f"\n[*] HTTP cache: {cache.hits} hits, {cache.misses} misses, {bytesto(cache.size, to='m'):.1f} MB"
+            )
+        END = time.time()
+        if g.profiler:
+            g.write_profile(g, END - BEGIN)
+        log.info(f"\n\n[%] Done! Total time to run: {END - BEGIN} seconds\n")
+
+    def write_profile(self, g, run_time):
+        """
+        Logs the per phase request accounting of --profile and writes it as
+        JSON next to the log file
+
+        Args:
+            g (github client): Instantiated Github client
+            run_time (Float): Total time of the run in seconds
+        """
+        from tabulate import tabulate
+
+        report = g.profiler.report()
+        report["run_time_s"] = round(run_time, 3)
+        log.info("")
+        log.info(
+            tabulate(
+                g.profiler.table(report),
+                headers=["Phase", "Requests", "p50 ms", "p95 ms", "p99 ms", "KB"],
+            )
+        )
+        extra_calls = report["repos_with_extra_calls"]
+        if extra_calls:
+            log.info(f"[!] {len(extra_calls)} repos needed extra requests")
+        # A library caller may not have the logs/ dir of the CLI
+        os.makedirs(LOG_DIR, exist_ok=True)
+        profile_file = f"{LOG_DIR}git_miner_{tstamp}.profile.json"
+        with open(profile_file, "w") as f:
+            json.dump(report, f, indent=2)
+        log.info(f"[*] Profile written to {profile_file}")
+
+    def open_sinks(self, g):
+        """
+        Opens the CSV/JSONL/Parquet outputs requested with -c/-j/--parquet.
+        Rows are streamed to them as repos are mined instead of being kept
+        until the end.
+
+        Args:
+            g (github client): Instantiated Github client
+        """
+        offsets = self.resumed.get("sinks", {})
+        tree = self.tree_filter is not None
+        if self.csv_file:
+            self.sinks.append(
+                CsvSink(self.csv_file, offsets.get(self.csv_file), tree=tree)
+            )
+        if self.json_file:
+            self.sinks.append(JsonlSink(self.json_file, offsets.get(self.json_file)))
+        if self.parquet_file:
+            self.sinks.append(ParquetSink(self.parquet_file, tree=tree))
+        if self.db_file:
+            self.sinks.append(DbSink(self.db_file, offsets.get(self.db_file)))
+
+    def close_sinks(self, g):
+        """
+        Flushes and closes the CSV/JSONL/Parquet outputs
+
+        Args:
+            g (github client): Instantiated Github client
+        """
+        for sink in self.sinks:
+            if isinstance(sink, DbSink):
+                sink.finish_run(self.org_count, self.repo_count)
+            sink.close()
+        self.sinks = []
+
+    def snapshot_rows(self, snapshot_file):
+        """
+        Reads a CSV/JSONL output of -c/-j or --merge
+
+        Args:
+            snapshot_file (String): CSV/JSONL output
+
+        Returns:
+            (generator): Org, repo name, core language, languages and root
+            files of each row
+        """
+        with open(snapshot_file, "r", newline="") as f:
+            first = f.readline()
+            f.seek(0)
+            if first.startswith("{"):
+                if "done_orgs" in json.loads(first):
+                    raise ValueError(f"{snapshot_file} is a checkpoint, not an output")
+                for line in f:
+                    if line.strip():
+                        yield snapshot_record(json.loads(line))
+                return
+            # CSV rows repeat the same few lists, parse each of them once
+            parsed = {}
+            for row in csv.DictReader(f):
+                # CsvSink writes None as ""
+                row["repo_lang"] = row["repo_lang"] or None
+                for key in ("repo_langs", "repo_tld"):
+                    value = parsed.get(row[key])
+                    if value is None:
+                        if len(parsed) > 100000:
+                            parsed.clear()
+                        value = parsed[row[key]] = ast.literal_eval(row[key])
+                    row[key] = value
+                yield snapshot_record(row)
+
+    def partition_snapshot(self, snapshot_file, directory, prefix, count):
+        """
+        Splits a snapshot into count temp files by a hash of org/repo, so a
+        repo lands in the partition of the same number in both snapshots
+
+        Args:
+            snapshot_file (String): CSV/JSONL output
+            directory (String): Directory of the partition files
+            prefix (String): Prefix of the partition file names
+            count (Integer): # of partitions
+
+        Returns:
+            (list): Paths of the partition files
+        """
+        # Read back by this same process, so rows are marshalled, in chunks
+        # prefixed with their length as marshal.load reads files piecemeal
+        paths = [os.path.join(directory, f"{prefix}_{n}") for n in range(count)]
+        files = [open(path, "wb") for path in paths]
+        chunks = [[] for _ in range(count)]
+        try:
+            for row in self.snapshot_rows(snapshot_file):
+                n = zlib.crc32(f"{row[0]}/{row[1]}".encode()) % count
+                chunks[n].append(row)
+                if len(chunks[n]) == DIFF_CHUNK:
+                    self.write_chunk(files[n], chunks[n])
+                    chunks[n] = []
+            for n, chunk in enumerate(chunks):
+                self.write_chunk(files[n], chunk)
+        finally:
+            for f in files:
+                f.close()
+        return paths
+
+    def write_chunk(self, f, chunk):
+        data = marshal.dumps(chunk)
+        f.write(len(data).to_bytes(4, "little"))
+        f.write(data)
+
+    def partition_rows(self, path):
+        with open(path, "rb") as f:
+            size = f.read(4)
+            while size:
+                yield from marshal.loads(f.read(int.from_bytes(size, "little")))
+                size = f.read(4)
+        os.remove(path)
+
+    def load_snapshot(self, rows, strings):
+        """
+        Args:
+            rows (iterable): Rows of snapshot_rows
+            strings (StringPool): Pool interning the orgs, languages and root
+                file lists of the partition, the same few lists repeat across
+                repos
+
+        Returns:
+            dict: (org, repo name) -> record of the repo, the last row of a
+            repo wins
+        """
+        records = {}
+        for org_login, name, language, languages, root_files in rows:
+            records[(strings(org_login), name)] = (
+                strings(language),
+                strings(tuple(languages)),
+                strings(tuple(root_files)),
+            )
+        return records
+
+    def diff_snapshots(self, g, old_file, new_file):
+        """
+        Compares two snapshots as a hash join on org/repo and logs a change
+        event per new, deleted and changed repo. Snapshots larger than
+        DIFF_PARTITION_BYTES are partitioned to temp files first, and the
+        partitions are joined one pair at a time.
+
+        Args:
+            g (github client): Instantiated Github client
+            old_file (String): CSV/JSONL output of the earlier run
+            new_file (String): CSV/JSONL output of the later run
+        """
+        size = max(os.path.getsize(old_file), os.path.getsize(new_file))
+        count = max(1, math.ceil(size / DIFF_PARTITION_BYTES))
+        g.snapshot_diff = SnapshotDiff()
+        if count == 1:
+            g.diff_partition(g, g.snapshot_rows(old_file), g.snapshot_rows(new_file))
+        else:
+            with tempfile.TemporaryDirectory(prefix="gitminer_diff_") as directory:
+                old_parts = g.partition_snapshot(old_file, directory, "old", count)
+                new_parts = g.partition_snapshot(new_file, directory, "new", count)
+                for old_part, new_part in zip(old_parts, new_parts):
+                    g.diff_partition(
+                        g, g.partition_rows(old_part), g.partition_rows(new_part)
+                    )
+        log.info(f"[.] Compared {old_file} and {new_file}, {count} partition(s)")
+
+    def diff_partition(self, g, old_rows, new_rows):
+        strings = StringPool()
+        old = self.load_snapshot(old_rows, strings)
+        new = self.load_snapshot(new_rows, strings)
+        for key in sorted(old.keys() | new.keys()):
+            change = g.snapshot_diff.compare(*key, old.get(key), new.get(key))
+            if change is None:
+                continue
+            if g.log_format == "tree":
+                log.info(LazyMessage(render_change, change))
+            elif g.log_format == "jsonl":
+                log.info(LazyMessage(json.dumps, change))
+
+    def print_diff(self, g, old_file, new_file):
+        """
+        Prints the summary of --diff, its root file churn and the core language
+        table of both snapshots
+
+        Args:
+            g (github client): Instantiated Github client
+            old_file (String): CSV/JSONL output of the earlier run
+            new_file (String): CSV/JSONL output of the later run
+        """
+        from tabulate import tabulate
+
+        diff = g.snapshot_diff
+        log.info(f"\n**************************************")
+        log.info(
+            f"[*] Old snapshot: {diff.old_repos} repos in {len(diff.old_orgs)} orgs ({old_file})"
+        )
+        log.info(
+            f"[*] New snapshot: {diff.new_repos} repos in {len(diff.new_orgs)} orgs ({new_file})"
+        )
+        log.info(
+            f"[*] Orgs: {len(diff.new_orgs - diff.old_orgs)} new, {len(diff.old_orgs - diff.new_orgs)} gone"
+        )
+        log.info(
+            f"[*] Repos: {diff.added} new, {diff.deleted} deleted, {diff.changed} changed"
+        )
+        log.info(f"[*] Core language changes: {diff.language_changes}")
+        log.info(f"**************************************")
+        root_files = diff.root_file_table()
+        if root_files:
+            log.info(
+                tabulate(root_files, headers=["Root file", "Appeared", "Vanished"])
+            )
+            log.info("")
+        log.info(
+            tabulate(diff.language_table(), headers=["Language", "Old", "New", "Delta"])
+        )
+        END = time.time()
+        log.info(f"\n\n[%] Done! Total time to run: {END - BEGIN} seconds\n")
+
+    def list_runs(self, g, db_file):
+        """
+        Logs the runs stored in a --db inventory
+
+        Args:
+            g (github client): Instantiated Github client
+            db_file (String): SQLite inventory written with --db
+        """
+        from tabulate import tabulate
+
+        db = sqlite3.connect(db_file)
+        runs = db.execute(
+            "SELECT id, started_at, finished_at, org_count, repo_count, command FROM runs ORDER BY id"
+        ).fetchall()
+        db.close()
+        log.info(
+            tabulate(
+                runs,
+                headers=["Run", "Started", "Finished", "Orgs", "Repos", "Command"],
+            )
+        )
+
+    def load_run(self, g, db_file, run_id):
+        """
+        Loads the counts of a run stored in a --db inventory, so print_details
+        shows its language table again
+
+        Args:
+            g (github client): Instantiated Github client
+            db_file (String): SQLite inventory written with --db
+            run_id (String): Id of the run, or "last"
+        """
+        db = sqlite3.connect(db_file)
+        if run_id == "last":
+            run = db.execute(
+                "SELECT id, started_at, org_count FROM runs ORDER BY id DESC LIMIT 1"
+            ).fetchone()
+        else:
+            run = db.execute(
+                "SELECT id, started_at, org_count FROM runs WHERE id = ?", (run_id,)
+            ).fetchone()
+        if not run:
+            db.close()
+            raise ValueError(f"no run {run_id} in {db_file}")
+        language_counts = db.execute(
+            "SELECT language, COUNT(*) FROM repos WHERE run_id = ? GROUP BY language",
+            (run[0],),
+        ).fetchall()
+        if run[2] is None:
+            # Interrupted run: only orgs with repos were recorded
+            org_count = db.execute(
+                "SELECT COUNT(*) FROM orgs WHERE run_id = ?", (run[0],)
+            ).fetchone()[0]
+        else:
+            org_count = run[2]
+        rows = db.execute(
+            """
+            SELECT repos.id, orgs.login, repo_languages.name, repo_languages.bytes
+            FROM repos
+            JOIN orgs ON orgs.id = repos.org_id
+            LEFT JOIN repo_languages ON repo_languages.repo_id = repos.id
+            WHERE repos.run_id = ?
+            ORDER BY repos.id
+            """,
+            (run[0],),
+        )
+        for _, languages in itertools.groupby(rows, key=lambda row: row[0]):
+            languages = list(languages)
+            self.language_stats.add(
+                languages[0][1],
+                {name: size for _, _, name, size in languages if name is not None},
+            )
+        db.close()
+        log.info(f"[.] Run {run[0]} started at {run[1]}")
+        self.merge_counts(
+            dict(language_counts),
+            org_count=org_count,
+            repo_count=sum(count for _, count in language_counts),
+        )
+
+
+class AsyncGithubCli(GithubCli):
+    """
+    GithubCli on an asyncio engine instead of PyGithub.
+
+    Requests go through one aiohttp session whose pool of keep-alive
+    connections is shared by up to self.concurrency requests in flight, with
+    the same rate limiter and response cache as the PyGithub path. The event
+    loop runs on a background thread and every method keeps its synchronous
+    signature, so main() and the reporting code are unchanged.
+    """
+
+    def __init__(self, repo: str = None, org: str = None, concurrency=64, **options):
+        super().__init__(repo, org, **options)
+        self.concurrency = max(concurrency, 1)
+        # Lets main() and get_all_repo_details treat it as a concurrent client
+        self.workers = concurrency
+        self.base_url = None
+        self.loop = None
+        self.session = None
+        self.semaphore = None
+        self.slots = None
+
+    def connect(self, url, token: str, tokens=None):
+        import asyncio
+
+        try:
+            import aiohttp
+        except ImportError:
+            raise ImportError(
+                "--engine async needs aiohttp, install it with: pip3 install aiohttp"
+            )
+        self.base_url = f"{self.root_url(url)}/api/v3"
+        self.limiter = self.create_limiter(token, tokens)
+        self.cache = self.create_cache()
+        self.profiler = self.create_profiler()
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
 
-log = logging.getLogger()
-log.setLevel(logging.INFO)
+        async def open_session():
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+            self.slots = asyncio.Semaphore(self.concurrency * 2)
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.concurrency),
+                timeout=aiohttp.ClientTimeout(total=60),
+                headers={
+                    "Accept": "application/vnd.github.v3+json",
+                    "User-Agent": "gitminer",
+                },
+            )
 
-tstamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
-output_file_handler = logging.FileHandler("{}git_miner_{}.log".format(LOG_DIR, tstamp))
-stdout_handler = logging.StreamHandler(sys.stdout)
-
-log.addHandler(output_file_handler)
-log.addHandler(stdout_handler)
-
-parser = argparse.ArgumentParser()
-parser.add_argument(
-    "--hostname",
-    dest="hostname",
-    help="Hostname URL: acme",
-    action="store",
-    required=True,
-)
-parser.add_argument(
-    "--org",
-    dest="org_name",
-    help="Organization Name(ex: Security)",
-    action="store",
-    required=False,
-)
-parser.add_argument(
-    "--repo",
-    dest="repo_name",
-    help="Repository Name(ex: GitMiner)",
-    action="store",
-    required=False,
-)
-parser.add_argument(
-    "-a",
-    "--all",
-    dest="all_orgs",
-    help="To run in all orgs and repos, set this flag.",
-    action="store_true",
-    default=False,
-    required=False,
-)
-parser.add_argument(
-    "-n",
-    "--noprompt",
-    dest="noprompt",
-    help="Do not prompt.",
-    action="store_true",
-    default=False,
-    required=False,
-)
-parser.add_argument(
-    "-c",
-    "--csv",
-    dest="csv_file",
-    help="write CSV data to file",
-    action="store",
-    required=False,
-)
-parser.add_argument(
-    "-j",
-    "--json",
-    dest="json_file",
-    help="write jsonL data to file",
-    action="store",
-    required=False,
-)
-
-args = parser.parse_args()
-hostname = args.hostname if args.hostname else None
-org_name = args.org_name if args.org_name else None
-repo_name = args.repo_name if args.repo_name else None
-all_orgs = args.all_orgs if args.all_orgs else None
-noprompt = args.noprompt if args.noprompt else None
-csv_file = args.csv_file if args.csv_file else None
-json_file = args.json_file if args.json_file else None
+        self.run(open_session())
+        atexit.register(self.close)
 
+    def close(self):
+        self.run(self.session.close())
 
-def bytesto(bytes, to, bsize=1024):
-    """
-    Converts bytes to a specific type of size
+    def run(self, coroutine):
+        """
+        Runs a coroutine on the engine's event loop and waits for its result
+        """
+        import asyncio
 
-    Args:
-        bytes (Integer): Number of Bytes to convert
-        to (String): The requested size to covert to
-        bsize (int, optional): Defaults to 1024.
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
 
-    Returns:
-        (Float): Returns a converted byte size as a Float
-    """
-    a = {"k": 1, "m": 2, "g": 3, "t": 4, "p": 5, "e": 6}
-    r = float(bytes)
-    return bytes / (bsize ** a[to])
+    def submit(self, fn, *args):
+        import asyncio
 
+        return asyncio.run_coroutine_threadsafe(fn(*args), self.loop)
 
-class GithubCli(object):
-    def __init__(self, repo: str = None, org: str = None):
-        self.client = None
-        self.orgs = None
-        self.org_name = None
-        self.org = None
-        self.repo = None
-        self.repo_name = None
-        self.repos = None
-        self.languages = None
-        self.contents = None
-        self.language_table = None
-        self.org_count = 0
-        self.repo_count = 0
-        self.language_dict = {}
-        self.identified_languages = set()
-        self.csv_file = csv_file
-        self.json_file = json_file
-        self.report_repos_by_org = []
+    async def request(self, url, params=None):
+        """
+        GETs an API URL through the rate limiter and the response cache
 
-    def connect(self, url, token: str):
-        self.client = Github(
-            base_url=f"https://{url}/api/v3", login_or_token=f"{token}"
-        )
+        Args:
+            url (String): Absolute URL, or path relative to the API root
+            params (dict, optional): Query parameters. Defaults to None.
+
+        Raises:
+            GithubException: If the API answers with an error status
+
+        Returns:
+            Tuple: (decoded JSON, URL of the next page or None)
+        """
+        import asyncio
+
+        from github import GithubException
+
+        if url.startswith("/"):
+            url = self.base_url + url
+        if params:
+            url = f"{url}?{urlencode(params)}"
+        async with self.semaphore:
+            for attempt in range(RATE_LIMIT_RETRIES + 1):
+                token, wait = self.limiter.reserve("core")
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                headers = {"Authorization": f"token {token}"}
+                if self.cache:
+                    headers.update(self.cache.validators(url))
+                started = time.perf_counter()
+                async with self.session.get(url, headers=headers) as r:
+                    body = await r.read()
+                    response = FetchedResponse(
+                        r.status, r.headers, body.decode(r.charset or "utf-8")
+                    )
+                if self.profiler:
+                    self.profiler.record(
+                        "GET", url, r.status, time.perf_counter() - started, len(body)
+                    )
+                if not self.limiter.update(token, "core", response):
+                    break
+        if self.cache:
+            if response.status_code == 304:
+                cached = self.cache.replay(url, response.headers)
+                if cached is None:
+                    return await self.request(url)
+                response = FetchedResponse(200, cached.headers, cached.text)
+            else:
+                self.cache.store(url, response)
+        data = json.loads(response.text) if response.text else None
+        if response.status_code >= 400:
+            raise GithubException(response.status_code, data, dict(response.headers))
+        match = re.search(r'<([^>]+)>;\s*rel="next"', response.headers.get("Link", ""))
+        return data, match.group(1) if match else None
+
+    async def paginate(self, url):
+        """
+        Returns:
+            List: Items of every page of a listing
+        """
+        items = []
+        next_url = url
+        params = {"per_page": 100}
+        while next_url:
+            data, next_url = await self.request(next_url, params)
+            items.extend(data)
+            params = None
+        return items
 
     def get_all_organizations(self):
-        return self.client.get_organizations()
+        return [JsonObject(org) for org in self.run(self.paginate("/organizations"))]
 
     def get_organization(self, org_name):
-        return self.client.get_organization(org_name)
-
-    def get_all_repos(self):
-        return self.client.get_repos(self.organization)
+        return JsonObject(self.run(self.request(f"/orgs/{org_name}"))[0])
 
     def get_repo(self, repo_name):
-        return self.org.get_repo(repo_name)
+        return self.listed_repo(
+            self.run(self.request(f"/repos/{self.org.login}/{repo_name}"))[0]
+        )
+
+    def get_languages(self):
+        return self.run(self.get_languages_async(self.repo))
 
     def get_file_contents(self):
-        return self.repo.get_contents("/")
+        return self.run(self.get_file_contents_async(self.repo))
 
-    def get_languages(self):
-        return self.repo.get_languages()
+    async def get_languages_async(self, repo):
+        data = (await self.request(f"/repos/{repo.full_name}/languages"))[0]
+        return self.pooled_languages(data)
 
-    def calculate_sum(self, dict):
-        """
-        Calculates the sum of the values of a dict
+    async def get_file_contents_async(self, repo):
+        data = (await self.request(f"/repos/{repo.full_name}/contents/"))[0]
+        return self.root_contents(content["path"] for content in data)
 
-        Args:
-            dict (dict): Calculates the sum of the values of languages_dict
+    async def get_tree_async(self, repo):
+        from github import GithubException
 
-        Returns:
-            Int: sum of the values
-        """
-        values = dict.values()
-        return sum(values)
+        walk = self.tree_filter.walk(repo.default_branch)
+        try:
+            request = next(walk)
+            while True:
+                sha, recursive = request
+                listing, _ = await self.request(
+                    f"/repos/{repo.full_name}/git/trees/{quote(sha, safe='')}",
+                    {"recursive": 1} if recursive else None,
+                )
+                request = walk.send(listing)
+        except StopIteration as stop:
+            return stop.value
+        except GithubException as e:
+            if e.status in (404, 409):
+                return []
+            raise
 
-    def percentage(self, count, total_count):
-        """
-        Calculates percentage given a count and total count
+    async def fetch_repo(self, repo):
+        import asyncio
 
-        Args:
-            count (Integer): # of times language appeared as core language
-            total_count (Integer): total count of languages
+        from github import GithubException
+
+        if self.stopped:
+            raise asyncio.CancelledError()
+        reused = self.reuse_repo(repo)
+        if reused:
+            return reused
+
+        if self.plan_repo(repo) == "no_languages":
+            # Known without a request, sleep(0) hands the result to gather
+            languages = asyncio.sleep(0, self.skip_languages())
+        else:
+            languages = self.get_languages_async(repo)
+        requests = [languages, self.get_file_contents_async(repo)]
+        if self.tree_filter:
+            requests.append(self.get_tree_async(repo))
+        languages, contents, *tree = await asyncio.gather(
+            *requests, return_exceptions=True
+        )
+        tree = tree[0] if tree else None
+        if isinstance(languages, Exception):
+            raise languages
+        if isinstance(tree, Exception):
+            raise tree
+        error = None
+        if isinstance(contents, GithubException):
+            contents, error = [], contents.args[1]["message"]
+        elif isinstance(contents, Exception):
+            raise contents
+
+        self.remember_repo(repo, languages, contents, error, tree)
+        return languages, contents, error, tree
+
+    async def fetch_batch(self, repos):
+        import asyncio
+
+        # A repo only gets a task once less than 2x concurrency repos are in
+        # flight, instead of every repo queued by --all at once
+        tasks = []
+        for repo in repos:
+            await self.slots.acquire()
+            task = asyncio.ensure_future(self.fetch_repo(repo))
+            task.add_done_callback(lambda _: self.slots.release())
+            tasks.append(task)
+        return await asyncio.gather(*tasks)
+
+    def fetch_repos(self, repos):
+        # Keep up to 2x concurrency repos scheduled, yielded in listing order
+        pending = deque()
+        for repo in repos:
+            pending.append((repo, self.submit(self.fetch_repo, repo)))
+            if len(pending) >= self.concurrency * 2:
+                repo, future = pending.popleft()
+                yield (repo,) + future.result()
+        while pending:
+            repo, future = pending.popleft()
+            yield (repo,) + future.result()
+
+    def get_repo_pages(self, org, start_page=0):
+        page = start_page
+        while True:
+            data, next_url = self.run(
+                self.request(
+                    f"/orgs/{org.login}/repos", {"per_page": 100, "page": page + 1}
+                )
+            )
+            repos = [self.listed_repo(repo) for repo in data]
+            if repos:
+                yield page, repos
+            if not next_url:
+                return
+            page += 1
+
+    def get_org_size(self, org):
+        if not hasattr(org, "public_repos"):
+            org.complete(self.run(self.request(f"/orgs/{org.login}"))[0])
+        return super().get_org_size(org)
+
+    def log_org(self, g):
+        if not hasattr(g.org, "email"):
+            g.org.complete(self.run(self.request(f"/orgs/{g.org.login}"))[0])
+        super().log_org(g)
+
+    async def list_org_repos(self, org):
+        if not hasattr(org, "email"):
+            # Orgs from the listing lack the details shown in the report
+            org.complete((await self.request(f"/orgs/{org.login}"))[0])
+        repos = []
+        page = self.resume_page(org.login)
+        while True:
+            data, next_url = await self.request(
+                f"/orgs/{org.login}/repos", {"per_page": 100, "page": page + 1}
+            )
+            repos.extend(self.plan_repos([self.listed_repo(repo) for repo in data]))
+            if not next_url:
+                return repos
+            page += 1
+
+
+class MirrorGithubCli(GithubCli):
+    """
+    GithubCli over local `git clone --mirror` copies instead of the API.
+
+    Mirrors are laid out as <dir>/<org>/<repo>.git and read with git on a
+    process pool of self.workers processes: root entries and bytes per
+    language of the default branch, without any request. The root tree SHA of
+    each mirror is kept in the cache dir, so a mirror whose tree didn't change
+    since the last run is rebuilt without reading its tree. Orgs have no email
+    offline, their URL is derived from the origin remote of their mirrors.
+    """
+
+    def __init__(self, repo: str = None, org: str = None, **options):
+        super().__init__(repo, org, **options)
+        self.mirrors_dir = None
+        self.pool = None
+        self.trees = {}
+        self.trees_file = None
+        self.tree_orgs = set()
+        self.tree_seen = set()
+
+    def connect(self, url, token: str = None, tokens=None):
+        from concurrent.futures import ProcessPoolExecutor
+
+        self.mirrors_dir = url
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self.trees_file = os.path.join(self.cache_dir, "mirror_trees.json")
+            if os.path.isfile(self.trees_file):
+                with open(self.trees_file, "r") as f:
+                    self.trees = json.load(f)
+                for cached in self.trees.values():
+                    cached["languages"] = self.pooled_languages(cached["languages"])
+                    cached["repo_tld"] = [self.strings(x) for x in cached["repo_tld"]]
+        if self.workers > 1:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers)
 
+    def close(self):
+        if self.pool:
+            self.pool.shutdown()
+            self.pool = None
+
+    def mirror_path(self, org_login, name):
+        return os.path.join(self.mirrors_dir, org_login, f"{name}.git")
+
+    def list_mirrors(self, org_login):
+        """
         Returns:
-            Integer: Returns the percentage as an int
+            List: Repo names of the mirrors of an org
         """
-        percentage = 100 * float(count) / float(total_count)
-        return str(int(percentage)) + "%"
+        org_dir = os.path.join(self.mirrors_dir, org_login)
+        return sorted(
+            name[: -len(".git")]
+            for name in os.listdir(org_dir)
+            if name.endswith(".git") and os.path.isdir(os.path.join(org_dir, name))
+        )
 
-    def create_table_list(self, dictionary):
+    def mirror_org(self, org_login):
         """
-        Creates a table list to display results using tabulate
+        Returns:
+            GraphqlOrg: Org of a mirrors dir, with the web URL of the org of its
+            origin remote, None if the origin is a local path
+        """
+        html_url = None
+        for name in self.list_mirrors(org_login)[:1]:
+            path = self.mirror_path(org_login, name)
+            html_url = remote_org_url(git(path, "config", "remote.origin.url").strip())
+        return GraphqlOrg(org_login, None, html_url)
 
-        Args:
-            dict (dict): language dictionary
+    def not_found(self):
+        from github import GithubException
+
+        return GithubException(404, {"message": "Not Found"}, None)
 
+    def get_all_organizations(self):
+        return [
+            self.mirror_org(login)
+            for login in sorted(os.listdir(self.mirrors_dir))
+            if os.path.isdir(os.path.join(self.mirrors_dir, login))
+        ]
+
+    def get_organization(self, org_name):
+        if not os.path.isdir(os.path.join(self.mirrors_dir, org_name)):
+            raise self.not_found()
+        return self.mirror_org(org_name)
+
+    def get_repo(self, repo_name):
+        if not os.path.isdir(self.mirror_path(self.org.login, repo_name)):
+            raise self.not_found()
+        return repo_name
+
+    def get_org_size(self, org):
+        return len(self.list_mirrors(org.login))
+
+    def get_repo_pages(self, org, start_page=0):
+        # A mirrors dir is listed at once, as a single page
+        if start_page == 0:
+            yield 0, self.list_mirrors(org.login)
+
+    def plan_repos(self, repos):
+        # Mirrors have no listing metadata, each one is scanned
+        return repos
+
+    def scan_args(self, org_login, name):
+        """
         Returns:
-            List: A Nested list of languages, count and percentage
+            Tuple: scan_mirror arguments of a mirror. Its cached tree only
+            counts if its files were listed with the same --full-tree filter.
         """
-        total_count = self.calculate_sum(dictionary)
-        language_table = []
-        for language, count in dictionary.items():
-            if not language:
-                language = "Empty"
-            percentage = self.percentage(count, total_count=total_count)
-            temp_list = [language, count, percentage]
-            language_table.append(temp_list)
-        language_table.sort(key=lambda language_table: language_table[1], reverse=True)
-        return language_table
+        cached = self.trees.get(f"{org_login}/{name}", {})
+        tree_key = self.tree_filter.key() if self.tree_filter else None
+        known = cached.get("tree") if cached.get("tree_filter") == tree_key else None
+        return self.mirror_path(org_login, name), known, self.tree_filter
 
-    def get_repo_details(self, g):
+    def scan(self, org_login, names):
         """
-        Gets all repository detailes including Org Name, Owner, Url, and Repositories and the following data:
-        - Repo Name
-        - Core Language
-        - All languages in the repo
-        - Root content files
+        Schedules scan_mirror for mirrors of an org on the process pool
 
-        Args:
-            g (github client): Instantiated Github client
+        Returns:
+            List: Futures of the scan_mirror results, in the order of names
         """
-        g.repos = g.org.get_repos()
+        return [
+            self.pool.submit(scan_mirror, *self.scan_args(org_login, name))
+            for name in names
+        ]
 
-        log.info(
-            f"\n{colored('Organization', color='blue', attrs=['bold', 'underline'])}: {g.org.login}"
-        )
-        log.info(
-            f"{colored('Owner', color='blue', attrs=['bold', 'underline'])}: {g.org.email}"
-        )
-        log.info(
-            f"{colored('Org Url', color='blue', attrs=['bold', 'underline'])}: {g.org.html_url}"
-        )
-        log.info(f"{colored('Repos', color='blue', attrs=['bold', 'underline'])}:")
-        for repo in g.repos:
-            g.repo = repo
+    def mirror_repo(self, org_login, name, result):
+        """
+        Turns a scan_mirror result into what report_repo takes, rebuilding an
+        unchanged tree from the tree cache
 
-            # TODO this duplicates get_single_repo_details?
-            g.repo_count += 1
-            g.languages = g.repo.get_languages()
-            try:
-                g.contents = g.repo.get_contents("/")
-            except GithubException as e:
-                log.info(f"[!] {e.args[1]['message']}")
-            log.info(f" |")
-            log.info(f" |- {colored(f'Repo Name', color='green')}: {g.repo.name}")
-            log.info(
-                f" |- {colored(f'Core Language', color='green')}: {g.repo.language}"
-            )
-            if g.repo.language not in g.identified_languages:
-                g.identified_languages.add(g.repo.language)
-                g.language_dict[g.repo.language] = 1
-            else:
-                g.language_dict[g.repo.language] += 1
-            log.info(f" |- {colored(f'Languages:', color='green')}")
-            for language, byte_size in g.languages.items():
-                byte_size = bytesto(byte_size, to="k")
-                log.info(f"  |")
-                log.info(f"   |- {colored(f'Language: {language}', attrs=['bold'])}")
-                log.info(
-                    f"   |- {colored(f'Byte Size: {byte_size} KB', attrs=['bold'])}"
-                )
-            log.info(f" |- {colored(f'Root Content Files:', color='green')}")
-            log.info(f"  |")
-            for content in g.contents:
-                log.info(f"   | * {colored(f'{content.path}', attrs=['bold'])}")
-
-            _repo = {
-                "org": g.org.login,
-                "org_owner": g.org.email,
-                "org_url": g.org.html_url,
-                "repo_name": g.repo.name,
-                "repo_lang": g.repo.language,
-                "repo_langs": [x for x in g.languages],
-                "repo_tld": [x.path for x in g.contents],
+        Returns:
+            Tuple: (repo, languages dict, root content files, error message,
+            tree files or None)
+        """
+        tree, languages, root, error, paths = result
+        key = f"{org_login}/{name}"
+        self.tree_orgs.add(org_login)
+        self.tree_seen.add(key)
+        if languages is None:
+            self.reused_count += 1
+            languages = self.trees[key]["languages"]
+            root = self.trees[key]["repo_tld"]
+            paths = self.trees[key].get("repo_tree")
+        elif tree:
+            # The tree cache is held for the whole run
+            languages = self.pooled_languages(languages)
+            root = [self.strings(x) for x in root]
+            self.trees[key] = {
+                "tree": tree,
+                "languages": languages,
+                "repo_tld": root,
+                "repo_tree": paths,
+                "tree_filter": self.tree_filter.key() if self.tree_filter else None,
             }
+        repo = GraphqlRepo(name, self.strings(next(iter(languages), None)))
+        return repo, languages, self.root_contents(root), error, paths
 
-            self.report_repos_by_org.append(_repo)
-
-        log.info(
-            f'{colored(f"[&] Total # of repos:", color="yellow")} {colored(str(g.repo_count), attrs=["underline", "bold"])}'
-        )
-        g.org_count += 1
+    def fetch_repos(self, repos):
+        if not self.pool:
+            for name in repos:
+                result = scan_mirror(*self.scan_args(self.org.login, name))
+                yield self.mirror_repo(self.org.login, name, result)
+            return
+        futures = self.scan(self.org.login, repos)
+        try:
+            for name, future in zip(repos, futures):
+                yield self.mirror_repo(self.org.login, name, future.result())
+        finally:
+            for future in futures:
+                future.cancel()
 
-    def get_single_repo_details(self, g):
+    def get_all_repo_details(self, g):
         """
-        Gets details for a single repository including Org Name, Owner, Url, and repo with the following data:
-        - Repo Name
-        - Core Language
-        - All languages in the repo
-        - Root content files
+        Same as GithubCli.get_all_repo_details, with the mirrors of every org
+        queued on the process pool at once
 
         Args:
             g (github client): Instantiated Github client
         """
-        log.info(
-            f"\n{colored('Organization', color='blue', attrs=['bold', 'underline'])}: {g.org.login}"
-        )
-        log.info(
-            f"{colored('Owner', color='blue', attrs=['bold', 'underline'])}: {g.org.email}"
-        )
-        log.info(
-            f"{colored('Org Url', color='blue', attrs=['bold', 'underline'])}: {g.org.html_url}"
-        )
-        log.info(f"{colored('Repos', color='blue', attrs=['bold', 'underline'])}:")
-        g.repo_count += 1
-        g.languages = g.repo.get_languages()
+        orgs = [org for org in g.orgs if org.login not in g.done_orgs]
+        jobs = [(org, g.list_mirrors(org.login)) for org in orgs]
+        units = [g.scan(org.login, names) for org, names in jobs]
         try:
-            g.contents = g.repo.get_contents("/")
-        except GithubException as e:
-            log.info(f"[!] {e.args[1]['message']}")
-        log.info(f" |")
-        log.info(f" |- {colored(f'Repo Name', color='green')}: {g.repo.name}")
-        log.info(f" |- {colored(f'Core Language', color='green')}: {g.repo.language}")
-        if g.repo.language not in g.identified_languages:
-            g.identified_languages.add(g.repo.language)
-            g.language_dict[g.repo.language] = 1
-        else:
-            g.language_dict[g.repo.language] += 1
-        log.info(f" |- {colored(f'Languages:', color='green')}")
-        for language, byte_size in g.languages.items():
-            byte_size = bytesto(byte_size, to="k")
-            log.info(f"  |")
-            log.info(f"   |- {colored(f'Language: {language}', attrs=['bold'])}")
-            log.info(f"   |- {colored(f'Byte Size: {byte_size} KB', attrs=['bold'])}")
-        log.info(f" |- {colored(f'Root Content Files:', color='green')}")
-        log.info(f"  |")
-        for content in g.contents:
-            log.info(f"   | * {colored(f'{content.path}', attrs=['bold'])}")
-        log.info(
-            f'{colored(f"[&] Total # of repos:", color="yellow")} {colored(str(g.repo_count), attrs=["underline", "bold"])}'
-        )
-        g.org_count += 1
+            for (org, names), futures in zip(jobs, units):
+                g.org = org
+                try:
+                    results = [future.result() for future in futures]
+                    g.log_org(g)
+                    for name, result in zip(names, results):
+                        g.report_repo(g, *g.mirror_repo(org.login, name, result))
+                    g.finish_org(g)
+                    g.finish_checkpoint_org(org.login)
+                except Exception as e:
+                    log.error(f"[!] Could not iterate because of: {e}")
+        finally:
+            # Mirrors still queued when mine() is stopped early are dropped
+            for future in itertools.chain.from_iterable(units):
+                future.cancel()
 
-    def print_details(self, g):
+    def close_sinks(self, g):
         """
-        Function used to print all data gathered results.
-        Prints out the total # of repos, orgs and provide a table of collected data
+        Closes the outputs, then writes the tree cache for the rows they hold.
+        Trees of the orgs mined in this run whose mirror is gone are dropped.
 
         Args:
             g (github client): Instantiated Github client
         """
-        log.info(f"\n**************************************")
-        log.info(f"[*] Grand Total number of Orgs: {g.org_count}")
-        log.info(f"[*] Grand Total number of Repos: {g.repo_count}")
-        log.info(f"**************************************")
-        g.language_table = self.create_table_list(g.language_dict)
+        super().close_sinks(g)
+        # The run is over, so is the process pool
+        self.close()
         log.info(
-            tabulate(g.language_table, headers=["Language", "Count", "Percentage"])
+            f"[*] Mirrors: {self.reused_count} unchanged trees reused, {len(self.tree_seen) - self.reused_count} read"
         )
-        END = time.time()
-        log.info(f"\n\n[%] Done! Total time to run: {END - BEGIN} seconds\n")
+        if not self.trees_file:
+            return
+        trees = {
+            key: value
+            for key, value in self.trees.items()
+            if key in self.tree_seen or key.split("/")[0] not in self.tree_orgs
+        }
+        with open(self.trees_file + ".tmp", "w") as f:
+            json.dump(trees, f)
+        os.replace(self.trees_file + ".tmp", self.trees_file)
 
-    def write_csv(self, g):
-        """
-        Function used to write CSV of all data gathered results.
-        Writes the total # of repos, orgs and provide a table of collected data
 
-        Args:
-            g (github client): Instantiated Github client
-        """
+def mine(
+    org=None,
+    repo=None,
+    sinks=None,
+    url=None,
+    token=None,
+    tokens=None,
+    config_file="config.json",
+    engine="rest",
+    mirrors=None,
+    **options,
+):
+    """
+    Library entry point: mines repos and yields a record per repo as soon as
+    it is mined. Nothing is prompted, printed or written besides the sinks,
+    mining runs on a background thread and stops when iteration does.
 
-        with open(self.csv_file, "w") as f:
-            fieldnames = [
-                "org",
-                "org_owner",
-                "org_url",
-                "repo_name",
-                "repo_lang",
-                "repo_langs",
-                "repo_tld",
-            ]
-            csvwriter = csv.DictWriter(f, fieldnames=fieldnames)
+        for record in gitminer.mine(org="DevOps", workers=8):
+            print(record["repo_name"], record["repo_langs"])
+
+    Args:
+        org (String, optional): Org to mine, every org of the instance if None. Defaults to None.
+        repo (String, optional): Only mine this repo of org. Defaults to None.
+        sinks (list, optional): CsvSink, JsonlSink, ParquetSink or DbSink objects the records are also written to, closed once mining ends. Defaults to None.
+        url (String, optional): GHE hostname, ACME_GITHUB_HOSTNAME of config_file if None. Defaults to None.
+        token (String, optional): Token, ACME_GITHUB_TOKEN of config_file if None. Defaults to None.
+        tokens (list, optional): Extra tokens to rotate across. Defaults to None.
+        config_file (String, optional): Config read for a missing url or token. Defaults to "config.json".
+        engine (String, optional): rest, graphql or async. Defaults to "rest".
+        mirrors (String, optional): Dir of bare mirrors to mine instead of the API, see --source. Defaults to None.
+        **options: Other GithubCli keyword arguments, like workers, cache_dir or state_file, whose state is saved once every repo was mined
 
-            csvwriter.writeheader()
-            for row in self.report_repos_by_org:
-                csvwriter.writerow(row)
+    Raises:
+        GithubException: If the org or repo doesn't exist or a request fails
 
-    def write_json(self, g):
-        """
-        Function used to write jsonL of all data gathered results.
-        Writes the total # of repos, orgs and provide a table of collected data
+    Yields:
+        dict: Record of a repo, with the fields of the -c/-j outputs
+    """
+    if repo and not org:
+        raise ValueError("mining a repo needs its org")
+    if not mirrors and (not url or not token):
+        config = load_config(config_file)
+        url = url if url else config["ACME_GITHUB_HOSTNAME"]
+        token = token if token else config["ACME_GITHUB_TOKEN"]
+        tokens = tokens if tokens is not None else config["ACME_GITHUB_TOKENS"]
+    options.setdefault("log_format", "quiet")
+    if mirrors:
+        g = MirrorGithubCli(**options)
+        url = mirrors
+    elif engine == "async":
+        g = AsyncGithubCli(engine=engine, **options)
+    else:
+        g = GithubCli(engine=engine, **options)
+    if g.state_file:
+        g.load_state()
+    g.connect(url, token, tokens)
+    records = QueueSink()
+    g.sinks = list(sinks if sinks else []) + [records]
+    done = object()
+    errors = []
 
-        Args:
-            g (github client): Instantiated Github client
-        """
+    def run():
+        finished = False
+        try:
+            if org:
+                g.org = g.get_organization(org)
+            if repo:
+                g.repo = g.get_repo(repo)
+                g.get_single_repo_details(g)
+            elif org:
+                g.get_repo_details(g)
+            else:
+                g.get_all_orgs_details(g)
+            finished = True
+        except MiningStopped:
+            pass
+        except Exception as e:
+            errors.append(e)
+        finally:
+            # A sink that fails to close is raised to the caller, which must
+            # get done either way or its iteration never ends
+            try:
+                g.close_sinks(g)
+                if finished and g.state_file:
+                    g.save_state()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                records.put(done)
 
-        with open(self.json_file, "w") as f:
-            for row in self.report_repos_by_org:
-                f.write(json.dumps(row))
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    try:
+        while True:
+            record = records.queue.get()
+            if record is done:
+                break
+            yield record
+        if errors:
+            raise errors[0]
+    finally:
+        g.stopped = records.stopped = True
+        thread.join()
+        g.close()
+
+
+def main(args):
+    """
+    Runs the CLI: mines one repo, one org or every org (--all) of a hostname
 
+    Args:
+        args (Namespace): Flags returned by parse_args
+    """
+    from github import GithubException
 
-def main(hostname=hostname, all_orgs=all_orgs, org_name=org_name, repo_name=repo_name):
+    hostname = args.hostname
+    all_orgs = args.all_orgs
+    org_name = args.org_name
+    repo_name = args.repo_name
     log.info(
         f'{colored(text=BANNER, color="blue", on_color="on_grey", attrs=["bold"])}'
     )
 
     # Convert hostname to lowercase to ensure proper input
-    hostname = hostname.lower()
+    hostname = hostname.lower() if hostname else None
 
     # Set the proper hostname based on '--hostname' argument flag provided
-    if hostname == "acme":
-        running_url = ACME_GITHUB_HOSTNAME
-        running_token = ACME_GITHUB_TOKEN
+    source, mirrors_dir = args.source
+    if source == "mirrors":
+        # Local mirrors need neither a hostname nor a token
+        hostname = running_url = mirrors_dir
+        running_token, running_tokens = None, None
+    elif hostname == "acme":
+        config = load_config()
+        running_url = config["ACME_GITHUB_HOSTNAME"]
+        running_token = config["ACME_GITHUB_TOKEN"]
+        running_tokens = config["ACME_GITHUB_TOKENS"]
     else:
         log.error("[.] Please set valid hostname flag(ex: acme) and try again")
         log.error("[*] Exiting...\n")
         sys.exit()
 
-    if not noprompt:
+    if not args.noprompt:
+        flush_log()
         a = input(
             colored(
                 text=f'[.] Are you sure you want to run this script in {colored(running_url, color="white", attrs=["bold", "underline"])}: (y/n)\n  > ',
@@ -433,43 +4426,58 @@ def main(hostname=hostname, all_orgs=all_orgs, org_name=org_name, repo_name=repo
             log.error("[*] Re-run script again with desired Hostname")
             sys.exit()
 
+    # Confirm --all before anything is opened, the outputs are truncated then
+    if all_orgs and not args.noprompt:
+        flush_log()
+        a = input(
+            colored(
+                text=f"[.] Are you sure you want to run this script for all orgs: (y/n)\n  > ",
+                color="red",
+            )
+        )
+        if a != "y":
+            log.info(f"[!] Please re-run script again. \n Exiting...")
+            sys.exit()
+
     # Instantiate Github Client
     try:
-        g = GithubCli()
-        g.connect(running_url, running_token)
+        if source == "mirrors":
+            g = MirrorGithubCli(**cli_options(args))
+        elif args.engine == "async":
+            g = AsyncGithubCli(concurrency=args.concurrency, **cli_options(args))
+        else:
+            g = GithubCli(**cli_options(args))
+        g.connect(running_url, running_token, running_tokens)
+        if args.state_file:
+            g.load_state()
+        if all_orgs:
+            # Checkpoint --all crawls so they can be resumed after a crash
+            g.checkpoint_file = (
+                args.resume_file
+                if args.resume_file
+                else f"{LOG_DIR}checkpoint_{tstamp}.json"
+            )
+            if args.resume_file:
+                g.load_checkpoint(args.resume_file)
+            log.info(
+                f"[.] Checkpointing to {g.checkpoint_file}, resume with --resume {g.checkpoint_file}"
+            )
+        g.open_sinks(g)
+        g.save_checkpoint()
     except Exception as e:
+        flush_log()
         print(f" * [E] Exception: {e}")
         exit(3)
     # if --all flags is set, this will run on all orgs and repos
     if all_orgs and not hostname:
         log.error("[!] Please enter a hostname and try again!")
     elif all_orgs and hostname:
-        if not noprompt:
-            a = input(
-                colored(
-                    text=f"[.] Are you sure you want to run this script for all orgs: (y/n)\n  > ",
-                    color="red",
-                )
-            )
-            if a != "y":
-                log.info(f"[!] Please re-run script again. \n Exiting...")
-                sys.exit()
-
-        # Get all organizations in Github
-        g.orgs = g.get_all_organizations()
-        # For each org, we will get different data points that will be useful
-        for org in g.orgs:
-            g.org = org
-            try:
-                g.get_repo_details(g)
-            except Exception as e:
-                log.error(f"[!] Could not iterate because of: {e}")
-                continue
+        g.get_all_orgs_details(g)
         g.print_details(g)
-        if csv_file:
-            g.write_csv(g)
-        if json_file:
-            g.write_json(g)
+        g.close_sinks(g)
+        if args.state_file:
+            g.save_state()
+        g.remove_checkpoint()
 
     # if --all flag is not provided, this will run
     elif org_name and not repo_name and not all_orgs:
@@ -492,10 +4500,9 @@ def main(hostname=hostname, all_orgs=all_orgs, org_name=org_name, repo_name=repo
         g.get_repo_details(g)
         g.print_details(g)
 
-        if csv_file:
-            g.write_csv(g)
-        if json_file:
-            g.write_json(g)
+        g.close_sinks(g)
+        if args.state_file:
+            g.save_state()
 
     elif org_name and repo_name:
         g.org_name = org_name
@@ -525,10 +4532,9 @@ def main(hostname=hostname, all_orgs=all_orgs, org_name=org_name, repo_name=repo
                 )
         g.get_single_repo_details(g)
         g.print_details(g)
-        if csv_file:
-            g.write_csv(g)
-        if json_file:
-            g.write_json(g)
+        g.close_sinks(g)
+        if args.state_file:
+            g.save_state()
 
     else:
         log.error(
@@ -538,15 +4544,68 @@ def main(hostname=hostname, all_orgs=all_orgs, org_name=org_name, repo_name=repo
                 attrs=["bold"],
             )
         )
-        parser.print_help()
+        flush_log()
+        build_parser().print_help()
         sys.exit()
 
 
+def merge(args):
+    """
+    Merges the outputs of --shard runs, see GithubCli.merge_shards
+
+    Args:
+        args (Namespace): Flags returned by parse_args, with the CSV/JSONL
+        outputs and checkpoints of the shards in merge_files
+    """
+    g = GithubCli(**cli_options(args))
+    g.open_sinks(g)
+    g.merge_shards(g, args.merge_files)
+    g.print_details(g)
+    g.close_sinks(g)
+
+
+def diff(args):
+    """
+    Compares two CSV/JSONL outputs, see GithubCli.diff_snapshots
+
+    Args:
+        args (Namespace): Flags returned by parse_args, with the old and new
+        output in diff_files
+    """
+    g = GithubCli(**cli_options(args))
+    old_file, new_file = args.diff_files
+    g.diff_snapshots(g, old_file, new_file)
+    g.print_diff(g, old_file, new_file)
+
+
+def query(args):
+    """
+    Shows the runs stored in a --db inventory (--runs), or the summary and
+    language table of one of them (--run)
+
+    Args:
+        args (Namespace): Flags returned by parse_args
+    """
+    g = GithubCli(**cli_options(args))
+    if args.list_runs:
+        g.list_runs(g, args.db_file)
+    if args.run_id:
+        g.load_run(g, args.db_file, args.run_id)
+        g.print_details(g)
+
+
 if __name__ == "__main__":
+    args = parse_args()
+    setup_logging()
     try:
-        main(
-            hostname=hostname, all_orgs=all_orgs, org_name=org_name, repo_name=repo_name
-        )
+        if args.merge_files:
+            merge(args)
+        elif args.diff_files:
+            diff(args)
+        elif args.list_runs or args.run_id:
+            query(args)
+        else:
+            main(args)
     except Exception as e:
         END = time.time()
         log.error("\n[!] ERROR encountered because of: {}".format(e))
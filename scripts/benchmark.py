@@ -0,0 +1,245 @@
+from tabulate import tabulate
+from urllib.request import urlopen
+import argparse
+import json
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+
+# Benchmarks gitminer offline against scripts/fake-ghe-server.py: every mode is
+# run in a subprocess and its wall time, requests/sec and peak RSS are reported.
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+GITMINER = os.path.join(os.path.dirname(SCRIPTS_DIR), "gitminer.py")
+FAKE_SERVER = os.path.join(SCRIPTS_DIR, "fake-ghe-server.py")
+
+
+# Start the fake GHE server and wait until it listens
+def start_server(args):
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            FAKE_SERVER,
+            "--port",
+            str(args.port),
+            "--orgs",
+            str(args.orgs),
+            "--repos",
+            str(args.repos),
+            "--max-repos",
+            str(args.max_repos),
+            "--seed",
+            args.seed,
+            "--latency",
+            str(args.latency),
+            "--rate-limit",
+            str(args.rate_limit),
+            "--rate-window",
+            str(args.rate_window),
+            "--error-rate",
+            str(args.error_rate),
+        ],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    print(server.stdout.readline().strip())
+    return server
+
+
+def server_stats(args, reset=False):
+    url = f"http://127.0.0.1:{args.port}/_stats" + ("?reset=1" if reset else "")
+    with urlopen(url) as response:
+        return json.load(response)
+
+
+# Run gitminer once and measure it. os.wait4 gives the peak RSS of that process
+# alone, in KB on Linux and bytes on macOS.
+def run_miner(args, work_dir, mode_args):
+    csv_file = os.path.join(work_dir, "out.csv")
+    command = (
+        [sys.executable, GITMINER, "--hostname", "acme", "-n", "--no-cache"]
+        + ["--log-format", "quiet", "-c", csv_file]
+        + mode_args
+        + shlex.split(args.miner_args)
+    )
+    server_stats(args, reset=True)
+    begin = time.perf_counter()
+    miner = subprocess.Popen(
+        command, cwd=work_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    _, status, usage = os.wait4(miner.pid, 0)
+    wall = time.perf_counter() - begin
+    requests = server_stats(args)["requests"]
+    rss = usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    with open(csv_file, "r") as f:
+        repos = max(sum(1 for _ in f) - 1, 0)
+    return {
+        "wall_s": round(wall, 3),
+        "requests": requests,
+        "requests_per_s": round(requests / wall, 1),
+        "peak_rss_mb": round(rss / 1024 / 1024, 1),
+        "repos": repos,
+        # Like os.waitstatus_to_exitcode, which needs Python 3.9
+        "exit_status": (
+            os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+        ),
+    }
+
+
+def benchmark(args):
+    server = start_server(args)
+    try:
+        enterprise = server_stats(args)
+        org = enterprise["largest_org"]
+        modes = {
+            "org": ["--org", org],
+            "repo": ["--org", org, "--repo", "repo0"],
+            "all": ["--all"],
+        }
+        results = []
+        with tempfile.TemporaryDirectory() as work_dir:
+            with open(os.path.join(work_dir, "config.json"), "w") as f:
+                json.dump(
+                    {
+                        "ACME_GITHUB_HOSTNAME": f"http://127.0.0.1:{args.port}",
+                        "ACME_GITHUB_TOKEN": "benchmark",
+                    },
+                    f,
+                )
+            for mode in args.modes:
+                runs = [
+                    run_miner(args, work_dir, modes[mode]) for _ in range(args.repeat)
+                ]
+                # Fastest of the repeats, the one least disturbed by the machine
+                result = dict(min(runs, key=lambda run: run["wall_s"]), mode=mode)
+                results.append(result)
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(
+        f"{enterprise['orgs']} orgs, {enterprise['repos']} repos, largest org {org}, "
+        f"{args.latency} ms latency, gitminer {args.miner_args or '(defaults)'}"
+    )
+    print(
+        tabulate(
+            [
+                [
+                    result["mode"],
+                    result["wall_s"],
+                    result["requests"],
+                    result["requests_per_s"],
+                    result["peak_rss_mb"],
+                    result["repos"],
+                    result["exit_status"],
+                ]
+                for result in results
+            ],
+            headers=[
+                "Mode",
+                "Wall s",
+                "Requests",
+                "Req/s",
+                "Peak RSS MB",
+                "Repos",
+                "Exit",
+            ],
+        )
+    )
+    if args.json_file:
+        with open(args.json_file, "w") as f:
+            json.dump(
+                {"enterprise": enterprise, "args": vars(args), "results": results},
+                f,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--modes",
+        dest="modes",
+        help="Modes to run, org and repo use the largest org (default: all three)",
+        nargs="+",
+        choices=["org", "repo", "all"],
+        default=["org", "repo", "all"],
+    )
+    parser.add_argument(
+        "--miner-args",
+        dest="miner_args",
+        help='Extra gitminer flags, ex: "--workers 16 --engine async"',
+        default="",
+    )
+    parser.add_argument(
+        "--repeat",
+        dest="repeat",
+        help="Runs of every mode, the fastest is reported (default: 1)",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--json",
+        dest="json_file",
+        help="Write the results to a JSON file, to compare runs",
+        required=False,
+    )
+    parser.add_argument(
+        "--port", dest="port", help="Port (default: 8765)", type=int, default=8765
+    )
+    parser.add_argument(
+        "--orgs",
+        dest="orgs",
+        help="Number of orgs (default: 100)",
+        type=int,
+        default=100,
+    )
+    parser.add_argument(
+        "--repos",
+        dest="repos",
+        help="Average # of repos per org (default: 20)",
+        type=int,
+        default=20,
+    )
+    parser.add_argument(
+        "--max-repos",
+        dest="max_repos",
+        help="Repos of the largest org (default: 2000)",
+        type=int,
+        default=2000,
+    )
+    parser.add_argument(
+        "--seed", dest="seed", help="Seed of the enterprise (default: 0)", default="0"
+    )
+    parser.add_argument(
+        "--latency",
+        dest="latency",
+        help="Milliseconds added to every request (default: 20)",
+        type=float,
+        default=20,
+    )
+    parser.add_argument(
+        "--rate-limit",
+        dest="rate_limit",
+        help="Requests per token and window (default: 5000)",
+        type=int,
+        default=5000,
+    )
+    parser.add_argument(
+        "--rate-window",
+        dest="rate_window",
+        help="Seconds until a token's rate limit resets (default: 3600)",
+        type=float,
+        default=3600,
+    )
+    parser.add_argument(
+        "--error-rate",
+        dest="error_rate",
+        help="Share of requests failing with a 502 (default: 0)",
+        type=float,
+        default=0,
+    )
+    benchmark(parser.parse_args())
@@ -0,0 +1,524 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+
+# Stand-in for the GHE API endpoints gitminer uses, serving a synthetic
+# enterprise generated from a seed, so the miner can be benchmarked offline:
+#
+#   GET  /api/v3/organizations           since/per_page pagination
+#   GET  /api/v3/orgs/{org}
+#   GET  /api/v3/orgs/{org}/repos        page/per_page pagination
+#   GET  /api/v3/repos/{org}/{repo}
+#   GET  /api/v3/repos/{org}/{repo}/languages
+#   GET  /api/v3/repos/{org}/{repo}/contents/
+#   GET  /api/v3/repos/{org}/{repo}/git/trees/{sha}
+#                                        recursive=1, truncated past --tree-limit
+#   POST /api/graphql                    the query of --engine graphql
+#   GET  /_stats                         requests served and enterprise size,
+#                                        ?reset=1 zeroes the requests
+#
+# Responses carry ETags and X-RateLimit-* headers like GHE does.
+
+LANGUAGES = [
+    "Python",
+    "Java",
+    "Go",
+    "JavaScript",
+    "TypeScript",
+    "Shell",
+    "HCL",
+    "Ruby",
+    "C++",
+    "Dockerfile",
+]
+ROOT_ENTRIES = [
+    "README.md",
+    "LICENSE",
+    ".gitignore",
+    "Dockerfile",
+    "Makefile",
+    "setup.py",
+    "package.json",
+    "src",
+    "docs",
+    "tests",
+]
+# Files under the directories of ROOT_ENTRIES, for the git trees API
+TREE_FILES = {
+    "src": [
+        "main.py",
+        "app/__init__.py",
+        "app/core/service.go",
+        "app/core/handlers.go",
+        "docker/Dockerfile",
+        "java/pom.xml",
+        "java/src/main/Main.java",
+        "web/index.ts",
+        "web/components/Button.tsx",
+    ],
+    "docs": ["index.md", "guide/setup.md", "guide/images/arch.png"],
+    "tests": ["test_app.py", "fixtures/data.json", "e2e/Dockerfile"],
+}
+
+
+# Synthetic enterprise: org sizes follow a long tail, like real enterprises where
+# a few orgs hold most of the repos
+class Enterprise(object):
+    def __init__(self, orgs, repos, max_repos, seed):
+        self.orgs = []
+        self.repos = {}
+        for number in range(orgs):
+            rand = random.Random(f"{seed}/{number}")
+            login = f"org{number}"
+            # Pareto with a mean of 3, scaled to the average # of repos per org
+            count = min(int(rand.paretovariate(1.5) * repos / 3), max_repos)
+            self.orgs.append({"id": number + 1, "login": login})
+            self.repos[login] = [
+                self.make_repo(rand, login, number * 100000 + r + 1, f"repo{r}")
+                for r in range(count)
+            ]
+
+    def make_repo(self, rand, login, repo_id, name):
+        empty = rand.random() < 0.1
+        languages = {}
+        if not empty:
+            for language in rand.sample(LANGUAGES, rand.randint(1, 4)):
+                languages[language] = int(rand.paretovariate(1.0) * 1000)
+        languages = dict(sorted(languages.items(), key=lambda item: -item[1]))
+        repo = {
+            "id": repo_id,
+            "name": name,
+            "full_name": f"{login}/{name}",
+            "language": next(iter(languages), None),
+            "size": 0 if empty else sum(languages.values()) // 1024 + 1,
+            "fork": rand.random() < 0.15,
+            "archived": rand.random() < 0.1,
+            "pushed_at": f"2024-{rand.randint(1, 12):02d}-{rand.randint(1, 28):02d}T00:00:00Z",
+            "default_branch": "main",
+            "languages": languages,
+            "entries": (
+                []
+                if empty
+                else sorted(
+                    rand.sample(ROOT_ENTRIES, rand.randint(1, len(ROOT_ENTRIES)))
+                )
+            ),
+        }
+        # Drawn from their own generator, so the rest of the enterprise is the
+        # same as without trees
+        files_rand = random.Random(f"{login}/{name}/files")
+        repo["files"] = []
+        for entry in repo["entries"]:
+            candidates = TREE_FILES.get(entry)
+            if not candidates:
+                repo["files"].append(entry)
+                continue
+            for file in files_rand.sample(
+                candidates, files_rand.randint(1, len(candidates))
+            ):
+                repo["files"].append(f"{entry}/{file}")
+        repo["files"].sort()
+        return repo
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in one write, no waiting on delayed ACKs
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def base(self):
+        return f"http://{self.headers['Host']}/api/v3"
+
+    def rate_limit(self, cost):
+        # Budget of each token, reset every --rate-window seconds
+        server = self.server
+        token = self.headers.get("Authorization", "")
+        with server.lock:
+            now = time.time()
+            budget = server.budgets.get(token)
+            if not budget or now >= budget["reset"]:
+                budget = server.budgets[token] = {
+                    "remaining": server.args.rate_limit,
+                    "reset": now + server.args.rate_window,
+                }
+            budget["remaining"] -= cost
+            return budget["remaining"], int(budget["reset"] + 0.999)
+
+    def send(self, status, obj, link=None, rate_limited=True):
+        body = json.dumps(obj).encode("utf-8")
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        # Unchanged resources cost no rate limit, like on GHE
+        unchanged = status == 200 and self.headers.get("If-None-Match") == etag
+        remaining, reset = (self.server.args.rate_limit, int(time.time()) + 3600)
+        if rate_limited:
+            remaining, reset = self.rate_limit(0 if unchanged else 1)
+            if remaining < 0:
+                status, etag = 403, None
+                body = json.dumps(
+                    {
+                        "message": "API rate limit exceeded",
+                        "documentation_url": "https://docs.github.com/rest/rate-limit",
+                    }
+                ).encode("utf-8")
+        if unchanged and status == 200:
+            status, body = 304, b""
+        headers = [
+            f"HTTP/1.1 {status} {self.responses.get(status, ('',))[0]}",
+            "Content-Type: application/json; charset=utf-8",
+            f"Content-Length: {len(body)}",
+            f"X-RateLimit-Limit: {self.server.args.rate_limit}",
+            f"X-RateLimit-Remaining: {max(remaining, 0)}",
+            f"X-RateLimit-Reset: {reset}",
+            "X-RateLimit-Resource: core",
+        ]
+        if etag:
+            headers.append(f"ETag: {etag}")
+        if link:
+            headers.append(f"Link: {link}")
+        self.wfile.write(("\r\n".join(headers) + "\r\n\r\n").encode("latin-1") + body)
+
+    def count(self):
+        with self.server.lock:
+            self.server.requests += 1
+        time.sleep(self.server.args.latency / 1000.0)
+
+    def inject_error(self):
+        # Every request but the org listing may fail, at --error-rate
+        with self.server.lock:
+            failed = self.server.random.random() < self.server.args.error_rate
+        if failed:
+            self.send(502, {"message": "Server Error"}, rate_limited=False)
+        return failed
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        path = url.path.rstrip("/")
+        query = parse_qs(url.query)
+        if path == "/_stats":
+            enterprise = self.server.enterprise
+            with self.server.lock:
+                stats = {
+                    "requests": self.server.requests,
+                    "orgs": len(enterprise.orgs),
+                    "repos": sum(len(repos) for repos in enterprise.repos.values()),
+                    "largest_org": max(
+                        enterprise.repos, key=lambda login: len(enterprise.repos[login])
+                    ),
+                }
+                if "reset" in query:
+                    self.server.requests = 0
+            self.send(200, stats, rate_limited=False)
+            return
+        self.count()
+        path = path[len("/api/v3") :] if path.startswith("/api/v3") else path
+        enterprise = self.server.enterprise
+        per_page = min(int(query.get("per_page", ["30"])[0]), 100)
+
+        if path == "/organizations":
+            since = int(query.get("since", ["0"])[0])
+            orgs = [org for org in enterprise.orgs if org["id"] > since][:per_page]
+            link = None
+            if orgs and orgs[-1]["id"] < enterprise.orgs[-1]["id"]:
+                link = f'<{self.base()}/organizations?since={orgs[-1]["id"]}&per_page={per_page}>; rel="next"'
+            self.send(200, [self.org_summary(org) for org in orgs], link)
+            return
+        if self.inject_error():
+            return
+
+        match = re.match(r"^/orgs/([^/]+)(/repos)?$", path)
+        if match and match.group(1) in enterprise.repos:
+            login = match.group(1)
+            repos = enterprise.repos[login]
+            if not match.group(2):
+                self.send(200, self.org_details(login, repos))
+                return
+            page = int(query.get("page", ["1"])[0])
+            last = max((len(repos) + per_page - 1) // per_page, 1)
+            link = None
+            if page < last:
+                link = ", ".join(
+                    [
+                        f'<{self.base()}/orgs/{login}/repos?page={page + 1}&per_page={per_page}>; rel="next"',
+                        f'<{self.base()}/orgs/{login}/repos?page={last}&per_page={per_page}>; rel="last"',
+                    ]
+                )
+            chunk = repos[(page - 1) * per_page : page * per_page]
+            self.send(200, [self.repo_details(login, repo) for repo in chunk], link)
+            return
+
+        match = re.match(
+            r"^/repos/([^/]+)/([^/]+)(?:/(languages|contents|git/trees/(.+)))?$", path
+        )
+        repo = None
+        if match and match.group(1) in enterprise.repos:
+            repo = next(
+                (
+                    r
+                    for r in enterprise.repos[match.group(1)]
+                    if r["name"] == match.group(2)
+                ),
+                None,
+            )
+        if repo is None:
+            self.send(404, {"message": "Not Found"})
+        elif match.group(3) is None:
+            self.send(200, self.repo_details(match.group(1), repo))
+        elif match.group(3) == "languages":
+            self.send(200, repo["languages"])
+        elif match.group(4) is not None:
+            self.send_tree(repo, match.group(4), "recursive" in query)
+        elif not repo["entries"]:
+            self.send(404, {"message": "This repository is empty."})
+        else:
+            self.send(200, [self.content(repo, name) for name in repo["entries"]])
+
+    # Trees are named by the sha of their path, the root tree by the branch too
+    def tree_sha(self, repo, path):
+        return hashlib.sha1(f"{repo['full_name']}:{path}".encode()).hexdigest()
+
+    def send_tree(self, repo, sha, recursive):
+        if not repo["files"]:
+            self.send(409, {"message": "Git Repository is empty."})
+            return
+        dirs = {""}
+        for file in repo["files"]:
+            parts = file.split("/")[:-1]
+            dirs.update("/".join(parts[: n + 1]) for n in range(len(parts)))
+        if sha == repo["default_branch"]:
+            root = ""
+        else:
+            root = next((d for d in dirs if self.tree_sha(repo, d) == sha), None)
+        if root is None:
+            self.send(404, {"message": "Not Found"})
+            return
+        prefix = root + "/" if root else ""
+        tree = []
+        for path in sorted(dirs - {""}) + repo["files"]:
+            if not path.startswith(prefix):
+                continue
+            relative = path[len(prefix) :]
+            if not recursive and "/" in relative:
+                continue
+            entry = {"path": relative, "mode": "100644", "type": "blob"}
+            if path in dirs:
+                entry.update(mode="040000", type="tree", sha=self.tree_sha(repo, path))
+            else:
+                entry.update(sha=self.tree_sha(repo, path), size=len(path) * 100)
+            tree.append(entry)
+        tree.sort(key=lambda entry: entry["path"])
+        # Only recursive listings are cut short, like on GHE
+        truncated = recursive and len(tree) > self.server.args.tree_limit
+        self.send(
+            200,
+            {
+                "sha": self.tree_sha(repo, root),
+                "url": f"{self.base()}/repos/{repo['full_name']}/git/trees/{sha}",
+                "tree": tree[: self.server.args.tree_limit] if truncated else tree,
+                "truncated": truncated,
+            },
+        )
+
+    def do_POST(self):
+        self.count()
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        if urlparse(self.path).path.rstrip("/") != "/api/graphql":
+            self.send(404, {"message": "Not Found"})
+            return
+        if self.inject_error():
+            return
+        variables = body.get("variables", {})
+        login = variables.get("org")
+        if login not in self.server.enterprise.repos:
+            self.send(
+                200,
+                {
+                    "data": {"organization": None},
+                    "errors": [
+                        {
+                            "message": f"Could not resolve to an Organization with the login of '{login}'."
+                        }
+                    ],
+                },
+            )
+            return
+        repos = self.server.enterprise.repos[login]
+        start = int(variables.get("cursor") or 0)
+        end = start + int(variables.get("pageSize", 50))
+        nodes = [
+            {
+                "name": repo["name"],
+                "diskUsage": repo["size"],
+                "isFork": repo["fork"],
+                "isArchived": repo["archived"],
+                "pushedAt": repo["pushed_at"],
+                "primaryLanguage": (
+                    {"name": repo["language"]} if repo["language"] else None
+                ),
+                "languages": {
+                    "edges": [
+                        {"size": size, "node": {"name": name}}
+                        for name, size in repo["languages"].items()
+                    ]
+                },
+                "object": (
+                    {"entries": [{"name": name} for name in repo["entries"]]}
+                    if repo["entries"]
+                    else None
+                ),
+            }
+            for repo in repos[start:end]
+        ]
+        details = self.org_details(login, repos)
+        self.send(
+            200,
+            {
+                "data": {
+                    "organization": {
+                        "login": login,
+                        "email": details["email"],
+                        "url": details["html_url"],
+                        "repositories": {
+                            "pageInfo": {
+                                "hasNextPage": end < len(repos),
+                                "endCursor": str(end),
+                            },
+                            "nodes": nodes,
+                        },
+                    }
+                }
+            },
+        )
+
+    def org_summary(self, org):
+        return {
+            "login": org["login"],
+            "id": org["id"],
+            "url": f"{self.base()}/orgs/{org['login']}",
+            "repos_url": f"{self.base()}/orgs/{org['login']}/repos",
+        }
+
+    def org_details(self, login, repos):
+        org = next(org for org in self.server.enterprise.orgs if org["login"] == login)
+        return dict(
+            self.org_summary(org),
+            email=f"{login}@acme.example",
+            html_url=f"http://{self.headers['Host']}/{login}",
+            public_repos=len(repos),
+            total_private_repos=0,
+        )
+
+    def repo_details(self, login, repo):
+        details = {
+            key: value
+            for key, value in repo.items()
+            if key not in ("languages", "entries", "files")
+        }
+        details["owner"] = {"login": login}
+        details["url"] = f"{self.base()}/repos/{login}/{repo['name']}"
+        details["html_url"] = f"http://{self.headers['Host']}/{login}/{repo['name']}"
+        return details
+
+    def content(self, repo, name):
+        url = f"{self.base()}/repos/{repo['full_name']}/contents/{name}"
+        return {
+            "type": "dir" if "." not in name and name != "Makefile" else "file",
+            "name": name,
+            "path": name,
+            "sha": hashlib.sha1(name.encode("utf-8")).hexdigest(),
+            "size": 0,
+            "url": url,
+            "html_url": url,
+            "git_url": url,
+            "download_url": url,
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--port", dest="port", help="Port (default: 8000)", type=int, default=8000
+    )
+    parser.add_argument(
+        "--orgs",
+        dest="orgs",
+        help="Number of orgs (default: 100)",
+        type=int,
+        default=100,
+    )
+    parser.add_argument(
+        "--repos",
+        dest="repos",
+        help="Average # of repos per org, a few orgs are much larger (default: 20)",
+        type=int,
+        default=20,
+    )
+    parser.add_argument(
+        "--max-repos",
+        dest="max_repos",
+        help="Repos of the largest org (default: 2000)",
+        type=int,
+        default=2000,
+    )
+    parser.add_argument(
+        "--seed", dest="seed", help="Seed of the enterprise (default: 0)", default="0"
+    )
+    parser.add_argument(
+        "--latency",
+        dest="latency",
+        help="Milliseconds added to every request (default: 0)",
+        type=float,
+        default=0,
+    )
+    parser.add_argument(
+        "--rate-limit",
+        dest="rate_limit",
+        help="Requests per token and window (default: 5000)",
+        type=int,
+        default=5000,
+    )
+    parser.add_argument(
+        "--rate-window",
+        dest="rate_window",
+        help="Seconds until a token's rate limit resets (default: 3600)",
+        type=float,
+        default=3600,
+    )
+    parser.add_argument(
+        "--error-rate",
+        dest="error_rate",
+        help="Share of requests failing with a 502 (default: 0)",
+        type=float,
+        default=0,
+    )
+    parser.add_argument(
+        "--tree-limit",
+        dest="tree_limit",
+        help="Entries of a recursive tree listing before it is truncated (default: 100000)",
+        type=int,
+        default=100000,
+    )
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), Handler)
+    server.daemon_threads = True
+    server.args = args
+    server.enterprise = Enterprise(args.orgs, args.repos, args.max_repos, args.seed)
+    server.random = random.Random(args.seed)
+    server.lock = threading.Lock()
+    server.budgets = {}
+    server.requests = 0
+    repos = sum(len(repos) for repos in server.enterprise.repos.values())
+    print(
+        f"Fake GHE with {args.orgs} orgs and {repos} repos on http://127.0.0.1:{args.port}",
+        flush=True,
+    )
+    server.serve_forever()
@@ -1,72 +1,366 @@
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
-from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
+from scipy.sparse import csr_matrix
+from sklearn.preprocessing import normalize
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import argparse
+import ast
 import glob
+import os
+import pickle
 
-# Function to load and aggregate data from multiple CSV files
-def load_and_aggregate_data(pattern):
-    files = glob.glob(pattern)
-    df_list = [pd.read_csv(file) for file in files]
-    aggregated_data = pd.concat(df_list, ignore_index=True)
+# Columns of the gitminer CSV output, read as strings instead of inferred
+DTYPES = {
+    "org": "string",
+    "org_owner": "string",
+    "org_url": "string",
+    "repo_name": "string",
+    "repo_lang": "string",
+    "repo_langs": "string",
+    "repo_tld": "string",
+}
+# Columns with few distinct values, kept as categoricals to save memory
+CATEGORIES = ["org", "org_owner", "org_url", "repo_lang", "repo_langs"]
+# Rows parsed at a time, so a large snapshot is never held as raw strings
+CHUNK_SIZE = 100000
+# Repos above which clustering runs in mini batches
+MINIBATCH_THRESHOLD = 20000
+
+
+# Concatenate frames, merging the categories of categorical columns instead of
+# falling back to object columns
+def concat_frames(frames):
+    if not frames:
+        # Categories of the same dtype as those of a snapshot read
+        return pd.DataFrame(
+            {
+                name: pd.Series(dtype=dtype).astype(
+                    "category" if name in CATEGORIES else dtype
+                )
+                for name, dtype in DTYPES.items()
+            }
+        )
+    columns = {}
+    for name in frames[0].columns:
+        if name in CATEGORIES:
+            columns[name] = pd.api.types.union_categoricals(
+                [frame[name] for frame in frames]
+            )
+        else:
+            columns[name] = pd.concat(
+                [frame[name] for frame in frames], ignore_index=True
+            )
+    return pd.DataFrame(columns)
+
+
+# Keep the latest row of each org/repo, rows of later frames win
+def latest_rows(frames):
+    data = concat_frames(frames)
+    return data.drop_duplicates(subset=["org", "repo_name"], keep="last").reset_index(
+        drop=True
+    )
+
+
+# Chunks of a Parquet snapshot. repo_langs is a list of {name, bytes} structs,
+# kept with its byte sizes in the repr the CSV output writes lists as.
+def read_parquet_chunks(file):
+    import pyarrow.parquet as pq
+
+    batches = pq.ParquetFile(file).iter_batches(
+        batch_size=CHUNK_SIZE, columns=list(DTYPES)
+    )
+    for batch in batches:
+        chunk = batch.to_pandas()
+        for name in ("repo_langs", "repo_tld"):
+            chunk[name] = chunk[name].map(
+                lambda x: str(list(x)) if x is not None else None
+            )
+        yield chunk
+
+
+# Read one CSV, JSONL or Parquet snapshot in chunks with explicit dtypes, only
+# its latest row of each org/repo is kept
+def read_snapshot(file):
+    chunks = []
+    if file.endswith(".parquet"):
+        reader = read_parquet_chunks(file)
+    elif file.endswith(".jsonl"):
+        reader = pd.read_json(file, lines=True, dtype=False, chunksize=CHUNK_SIZE)
+    else:
+        reader = pd.read_csv(
+            file, dtype=DTYPES, usecols=list(DTYPES), chunksize=CHUNK_SIZE
+        )
+    for chunk in reader:
+        if file.endswith(".jsonl"):
+            # Lists are stored like the CSV output writes them
+            for name in ("repo_langs", "repo_tld"):
+                chunk[name] = chunk[name].map(
+                    lambda x: str(x) if isinstance(x, list) else x
+                )
+        chunk = chunk[list(DTYPES)].astype(DTYPES)
+        for name in CATEGORIES:
+            chunk[name] = chunk[name].astype("category")
+        chunks.append(chunk)
+    return latest_rows(chunks)
+
+
+# Function to load and aggregate data from multiple CSV/JSONL/Parquet files.
+# Snapshots are read in parallel, a few at a time, and folded into the latest
+# row of each org/repo as they arrive, so memory doesn't grow with the number
+# of snapshots. The result is cached next to the snapshots until one of them
+# changes.
+def load_and_aggregate_data(pattern, cache_file="data_cache.pkl"):
+    # The cache may match the pattern too, e.g. data_*
+    files = [file for file in glob.glob(pattern) if file != cache_file]
+    # Oldest snapshot first, so later rows win the de-duplication
+    files.sort(key=lambda file: (os.path.getmtime(file), file))
+    key = [(file, os.path.getmtime(file), os.path.getsize(file)) for file in files]
+    if cache_file and os.path.isfile(cache_file):
+        with open(cache_file, "rb") as f:
+            cached = pickle.load(f)
+        if cached["key"] == key:
+            return cached["data"]
+
+    workers = os.cpu_count() or 1
+    aggregated_data = concat_frames([])
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for file in files:
+            pending.append(executor.submit(read_snapshot, file))
+            if len(pending) > workers:
+                aggregated_data = latest_rows(
+                    [aggregated_data, pending.popleft().result()]
+                )
+        while pending:
+            aggregated_data = latest_rows([aggregated_data, pending.popleft().result()])
+    # Values of repos that were replaced are still categories
+    for name in CATEGORIES:
+        aggregated_data[name] = aggregated_data[name].cat.remove_unused_categories()
+
+    if cache_file:
+        with open(cache_file, "wb") as f:
+            pickle.dump(
+                {"key": key, "data": aggregated_data},
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
     return aggregated_data
 
 
-# Data visualization function
-def visualize_data(data):
-    # Example: Bar plot of repositories per organization
-    org_repo_counts = data["org"].value_counts()
+# Largest n counts, the rest summed up as "Other", so plots stay readable
+def top_n(counts, n):
+    counts = counts[counts > 0].sort_values(ascending=False)
+    top = pd.Series(counts.values[:n], index=[str(x) for x in counts.index[:n]])
+    if len(counts) > n:
+        top["Other"] = counts.values[n:].sum()
+    return top
+
+
+# Bar plot of repositories per organization
+def plot_org_repos(org_repo_counts):
     plt.figure(figsize=(10, 6))
     sns.barplot(x=org_repo_counts.index, y=org_repo_counts.values)
     plt.xlabel("Organization")
     plt.ylabel("Number of Repositories")
     plt.title("Repositories per Organization")
     plt.xticks(rotation=45)
-    plt.tight_layout()
-    plt.show()
 
-    # Example: Pie chart of programming languages usage
-    language_counts = data["repo_lang"].value_counts()
+
+# Pie chart of programming languages usage
+def plot_languages(language_counts):
     plt.figure(figsize=(8, 8))
     plt.pie(
         language_counts, labels=language_counts.index, autopct="%1.1f%%", startangle=140
     )
     plt.title("Programming Languages Usage")
+
+
+# Heatmap of the share of each cluster's repos using each language
+def plot_clusters(cluster_languages):
+    plt.figure(figsize=(12, 6))
+    sns.heatmap(cluster_languages, cmap="viridis", annot=True, fmt=".0%")
+    plt.xlabel("Language")
+    plt.ylabel("Cluster")
+    plt.title("Repository Clusters by Language Usage")
+
+
+# Draw one figure, to a file in out_dir or on screen
+def render_figure(figure, out_dir=None, fmt="png"):
+    plot, args, name = figure
+    if out_dir:
+        plt.switch_backend("Agg")
+    plot(*args)
     plt.tight_layout()
-    plt.show()
+    if out_dir:
+        plt.savefig(os.path.join(out_dir, f"{name}.{fmt}"))
+        plt.close()
+    else:
+        plt.show()
+
+
+# Draw figures, rendering them to files in parallel processes in headless mode
+def render_figures(figures, out_dir=None, fmt="png"):
+    if not out_dir:
+        for figure in figures:
+            render_figure(figure)
+        return
+    os.makedirs(out_dir, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=len(figures)) as executor:
+        list(executor.map(render_figure, figures, repeat(out_dir), repeat(fmt)))
+
+
+# Data visualization function, returns the figures to render
+def visualize_data(data, top=20):
+    return [
+        (plot_org_repos, (top_n(data["org"].value_counts(), top),), "org_repos"),
+        (plot_languages, (top_n(data["repo_lang"].value_counts(), top),), "languages"),
+    ]
+
 
+# Languages of a repo and their weights. repo_langs is a list of names in JSONL
+# files, the repr of that list in CSV files and a list of {name, bytes} structs
+# in Parquet files, the only ones with byte sizes.
+def language_weights(repo_langs):
+    if isinstance(repo_langs, str):
+        repo_langs = ast.literal_eval(repo_langs)
+    if repo_langs is None or repo_langs is pd.NA or isinstance(repo_langs, float):
+        return {}
+    weights = {}
+    for language in repo_langs:
+        if isinstance(language, dict):
+            weights[language["name"]] = language["bytes"] or 1
+        else:
+            weights[language] = 1
+    return weights
 
-# Machine learning function: Clustering repositories by language usage
-def cluster_repositories(data):
+
+# Sparse repos x languages matrix of each repo's share of bytes per language,
+# scaled to unit length
+def language_features(data):
+    languages = {}
+    parsed = {}
+    rows, columns, values = [], [], []
+    for row, repo_langs in enumerate(data["repo_langs"]):
+        if isinstance(repo_langs, str):
+            # CSV rows repeat the same few lists, parse each of them once
+            if repo_langs not in parsed:
+                parsed[repo_langs] = language_weights(repo_langs)
+            weights = parsed[repo_langs]
+        else:
+            weights = language_weights(repo_langs)
+        total = sum(weights.values())
+        for language, weight in weights.items():
+            rows.append(row)
+            columns.append(languages.setdefault(language, len(languages)))
+            values.append(weight / total)
+    features = csr_matrix(
+        (values, (rows, columns)), shape=(len(data), max(len(languages), 1))
+    )
+    return normalize(features), list(languages)
+
+
+# Machine learning function: Clustering repositories by language usage, returns
+# the figures to render
+def cluster_repositories(data, n_clusters=5, minibatch=None, top=20):
     # Select relevant features for clustering
-    features = data["repo_langs"].apply(lambda x: ",".join(x)).str.get_dummies(sep=",")
-    scaler = StandardScaler()
-    scaled_features = scaler.fit_transform(features)
+    features, languages = language_features(data)
+    n_clusters = min(n_clusters, len(data))
 
-    # Apply KMeans clustering
-    kmeans = KMeans(n_clusters=5, random_state=42)
-    data["cluster"] = kmeans.fit_predict(scaled_features)
+    # Apply KMeans clustering, in mini batches for large inventories
+    if minibatch is None:
+        minibatch = len(data) > MINIBATCH_THRESHOLD
+    if minibatch:
+        kmeans = MiniBatchKMeans(
+            n_clusters=n_clusters, random_state=42, batch_size=4096, n_init=3
+        )
+    else:
+        kmeans = KMeans(n_clusters=n_clusters, random_state=42)
+    data["cluster"] = kmeans.fit_predict(features)
 
-    # Visualize clusters
-    plt.figure(figsize=(10, 6))
-    sns.scatterplot(
-        x=data["repo_name"], y=data["cluster"], hue=data["cluster"], palette="viridis"
+    # Share of each cluster's repos using the top languages and any other one
+    used = (features > 0).astype(float)
+    clusters = csr_matrix(
+        ([1.0] * len(data), (data["cluster"], range(len(data)))),
+        shape=(n_clusters, len(data)),
     )
-    plt.xlabel("Repository")
-    plt.ylabel("Cluster")
-    plt.title("Repository Clusters by Language Usage")
-    plt.xticks(rotation=90)
-    plt.tight_layout()
-    plt.show()
+    sizes = clusters.sum(axis=1).A1
+    top_languages = (-used.sum(axis=0).A1).argsort()[: min(top, len(languages))]
+    others = sorted(set(range(len(languages))) - set(top_languages))
+    cluster_languages = pd.DataFrame(
+        (clusters @ used[:, top_languages]).toarray() / sizes.clip(min=1)[:, None],
+        columns=[languages[n] for n in top_languages],
+        index=[f"{c} ({int(size)} repos)" for c, size in enumerate(sizes)],
+    )
+    if others:
+        any_other = (used[:, others].sum(axis=1).A1 > 0).astype(float)
+        cluster_languages["Other"] = (clusters @ any_other) / sizes.clip(min=1)
+    return [(plot_clusters, (cluster_languages,), "clusters")]
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--pattern",
+        dest="pattern",
+        help="Snapshot files to aggregate, CSV, JSONL or Parquet (default: data_*.csv)",
+        default="data_*.csv",
+        required=False,
+    )
+    parser.add_argument(
+        "--clusters",
+        dest="clusters",
+        help="Number of repo clusters (default: 5)",
+        type=int,
+        default=5,
+        required=False,
+    )
+    parser.add_argument(
+        "--top",
+        dest="top",
+        help="Orgs and languages plotted, the others are summed up (default: 20)",
+        type=int,
+        default=20,
+        required=False,
+    )
+    parser.add_argument(
+        "--out-dir",
+        dest="out_dir",
+        help="Render the figures to files in this directory instead of showing them",
+        required=False,
+    )
+    parser.add_argument(
+        "--format",
+        dest="fmt",
+        help="Format of the figures rendered with --out-dir (default: png)",
+        choices=["png", "svg"],
+        default="png",
+        required=False,
+    )
+    parser.add_argument(
+        "--minibatch",
+        dest="minibatch",
+        help=f"Cluster in mini batches, the default above {MINIBATCH_THRESHOLD} repos",
+        action="store_true",
+        default=None,
+        required=False,
+    )
+    args = parser.parse_args()
+
     # Load and aggregate data
-    aggregated_data = load_and_aggregate_data("data_*.csv")
+    aggregated_data = load_and_aggregate_data(args.pattern)
 
     # Visualize data
-    visualize_data(aggregated_data)
+    figures = visualize_data(aggregated_data, top=args.top)
 
     # Apply machine learning and visualize results
-    cluster_repositories(aggregated_data)
+    figures += cluster_repositories(
+        aggregated_data,
+        n_clusters=args.clusters,
+        minibatch=args.minibatch,
+        top=args.top,
+    )
+    render_figures(figures, out_dir=args.out_dir, fmt=args.fmt)
@@ -1,78 +1,251 @@
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
-from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
-import json
+from scipy.sparse import csr_matrix
+from sklearn.preprocessing import normalize
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import argparse
+import ast
+import os
+
+# Repos above which clustering runs in mini batches
+MINIBATCH_THRESHOLD = 20000
+
 
 # Load the data collected by DataScoop
-def load_data(csv_file=None, json_file=None):
+def load_data(csv_file=None, json_file=None, parquet_file=None):
     if csv_file:
         data = pd.read_csv(csv_file)
     elif json_file:
-        with open(json_file, "r") as file:
-            data = pd.DataFrame(json.load(file))
+        # -j writes JSON Lines, one repo per line
+        data = pd.read_json(json_file, lines=True)
+    elif parquet_file:
+        data = pd.read_parquet(parquet_file)
     else:
         raise ValueError("No file provided")
     return data
 
 
-# Data visualization function
-def visualize_data(data):
-    # Example: Bar plot of repositories per organization
-    org_repo_counts = data["org"].value_counts()
+# Largest n counts, the rest summed up as "Other", so plots stay readable
+def top_n(counts, n):
+    counts = counts[counts > 0].sort_values(ascending=False)
+    top = pd.Series(counts.values[:n], index=[str(x) for x in counts.index[:n]])
+    if len(counts) > n:
+        top["Other"] = counts.values[n:].sum()
+    return top
+
+
+# Bar plot of repositories per organization
+def plot_org_repos(org_repo_counts):
     plt.figure(figsize=(10, 6))
     sns.barplot(x=org_repo_counts.index, y=org_repo_counts.values)
     plt.xlabel("Organization")
     plt.ylabel("Number of Repositories")
     plt.title("Repositories per Organization")
     plt.xticks(rotation=45)
-    plt.tight_layout()
-    plt.show()
 
-    # Example: Pie chart of programming languages usage
-    language_counts = data["repo_lang"].value_counts()
+
+# Pie chart of programming languages usage
+def plot_languages(language_counts):
     plt.figure(figsize=(8, 8))
     plt.pie(
         language_counts, labels=language_counts.index, autopct="%1.1f%%", startangle=140
     )
     plt.title("Programming Languages Usage")
+
+
+# Heatmap of the share of each cluster's repos using each language
+def plot_clusters(cluster_languages):
+    plt.figure(figsize=(12, 6))
+    sns.heatmap(cluster_languages, cmap="viridis", annot=True, fmt=".0%")
+    plt.xlabel("Language")
+    plt.ylabel("Cluster")
+    plt.title("Repository Clusters by Language Usage")
+
+
+# Draw one figure, to a file in out_dir or on screen
+def render_figure(figure, out_dir=None, fmt="png"):
+    plot, args, name = figure
+    if out_dir:
+        plt.switch_backend("Agg")
+    plot(*args)
     plt.tight_layout()
-    plt.show()
+    if out_dir:
+        plt.savefig(os.path.join(out_dir, f"{name}.{fmt}"))
+        plt.close()
+    else:
+        plt.show()
+
+
+# Draw figures, rendering them to files in parallel processes in headless mode
+def render_figures(figures, out_dir=None, fmt="png"):
+    if not out_dir:
+        for figure in figures:
+            render_figure(figure)
+        return
+    os.makedirs(out_dir, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=len(figures)) as executor:
+        list(executor.map(render_figure, figures, repeat(out_dir), repeat(fmt)))
 
 
-# Machine learning function: Clustering repositories by language usage
-def cluster_repositories(data):
+# Data visualization function, returns the figures to render
+def visualize_data(data, top=20):
+    return [
+        (plot_org_repos, (top_n(data["org"].value_counts(), top),), "org_repos"),
+        (plot_languages, (top_n(data["repo_lang"].value_counts(), top),), "languages"),
+    ]
+
+
+# Languages of a repo and their weights. repo_langs is a list of names in JSONL
+# files, the repr of that list in CSV files and a list of {name, bytes} structs
+# in Parquet files, the only ones with byte sizes.
+def language_weights(repo_langs):
+    if isinstance(repo_langs, str):
+        repo_langs = ast.literal_eval(repo_langs)
+    if repo_langs is None or repo_langs is pd.NA or isinstance(repo_langs, float):
+        return {}
+    weights = {}
+    for language in repo_langs:
+        if isinstance(language, dict):
+            weights[language["name"]] = language["bytes"] or 1
+        else:
+            weights[language] = 1
+    return weights
+
+
+# Sparse repos x languages matrix of each repo's share of bytes per language,
+# scaled to unit length
+def language_features(data):
+    languages = {}
+    parsed = {}
+    rows, columns, values = [], [], []
+    for row, repo_langs in enumerate(data["repo_langs"]):
+        if isinstance(repo_langs, str):
+            # CSV rows repeat the same few lists, parse each of them once
+            if repo_langs not in parsed:
+                parsed[repo_langs] = language_weights(repo_langs)
+            weights = parsed[repo_langs]
+        else:
+            weights = language_weights(repo_langs)
+        total = sum(weights.values())
+        for language, weight in weights.items():
+            rows.append(row)
+            columns.append(languages.setdefault(language, len(languages)))
+            values.append(weight / total)
+    features = csr_matrix(
+        (values, (rows, columns)), shape=(len(data), max(len(languages), 1))
+    )
+    return normalize(features), list(languages)
+
+
+# Machine learning function: Clustering repositories by language usage, returns
+# the figures to render
+def cluster_repositories(data, n_clusters=5, minibatch=None, top=20):
     # Select relevant features for clustering
-    features = data["repo_langs"].apply(lambda x: ",".join(x)).str.get_dummies(sep=",")
-    scaler = StandardScaler()
-    scaled_features = scaler.fit_transform(features)
+    features, languages = language_features(data)
+    n_clusters = min(n_clusters, len(data))
 
-    # Apply KMeans clustering
-    kmeans = KMeans(n_clusters=5, random_state=42)
-    data["cluster"] = kmeans.fit_predict(scaled_features)
+    # Apply KMeans clustering, in mini batches for large inventories
+    if minibatch is None:
+        minibatch = len(data) > MINIBATCH_THRESHOLD
+    if minibatch:
+        kmeans = MiniBatchKMeans(
+            n_clusters=n_clusters, random_state=42, batch_size=4096, n_init=3
+        )
+    else:
+        kmeans = KMeans(n_clusters=n_clusters, random_state=42)
+    data["cluster"] = kmeans.fit_predict(features)
 
-    # Visualize clusters
-    plt.figure(figsize=(10, 6))
-    sns.scatterplot(
-        x=data["repo_name"], y=data["cluster"], hue=data["cluster"], palette="viridis"
+    # Share of each cluster's repos using the top languages and any other one
+    used = (features > 0).astype(float)
+    clusters = csr_matrix(
+        ([1.0] * len(data), (data["cluster"], range(len(data)))),
+        shape=(n_clusters, len(data)),
     )
-    plt.xlabel("Repository")
-    plt.ylabel("Cluster")
-    plt.title("Repository Clusters by Language Usage")
-    plt.xticks(rotation=90)
-    plt.tight_layout()
-    plt.show()
+    sizes = clusters.sum(axis=1).A1
+    top_languages = (-used.sum(axis=0).A1).argsort()[: min(top, len(languages))]
+    others = sorted(set(range(len(languages))) - set(top_languages))
+    cluster_languages = pd.DataFrame(
+        (clusters @ used[:, top_languages]).toarray() / sizes.clip(min=1)[:, None],
+        columns=[languages[n] for n in top_languages],
+        index=[f"{c} ({int(size)} repos)" for c, size in enumerate(sizes)],
+    )
+    if others:
+        any_other = (used[:, others].sum(axis=1).A1 > 0).astype(float)
+        cluster_languages["Other"] = (clusters @ any_other) / sizes.clip(min=1)
+    return [(plot_clusters, (cluster_languages,), "clusters")]
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--csv", dest="csv_file", help="CSV file written with -c", required=False
+    )
+    parser.add_argument(
+        "--json", dest="json_file", help="JSONL file written with -j", required=False
+    )
+    parser.add_argument(
+        "--parquet",
+        dest="parquet_file",
+        help="Parquet file written with --parquet, clusters weighted by bytes",
+        required=False,
+    )
+    parser.add_argument(
+        "--clusters",
+        dest="clusters",
+        help="Number of repo clusters (default: 5)",
+        type=int,
+        default=5,
+        required=False,
+    )
+    parser.add_argument(
+        "--top",
+        dest="top",
+        help="Orgs and languages plotted, the others are summed up (default: 20)",
+        type=int,
+        default=20,
+        required=False,
+    )
+    parser.add_argument(
+        "--out-dir",
+        dest="out_dir",
+        help="Render the figures to files in this directory instead of showing them",
+        required=False,
+    )
+    parser.add_argument(
+        "--format",
+        dest="fmt",
+        help="Format of the figures rendered with --out-dir (default: png)",
+        choices=["png", "svg"],
+        default="png",
+        required=False,
+    )
+    parser.add_argument(
+        "--minibatch",
+        dest="minibatch",
+        help=f"Cluster in mini batches, the default above {MINIBATCH_THRESHOLD} repos",
+        action="store_true",
+        default=None,
+        required=False,
+    )
+    args = parser.parse_args()
+
     # Load data
+    if not (args.csv_file or args.json_file or args.parquet_file):
+        args.csv_file = "datascoop_data.csv"
     data = load_data(
-        csv_file="datascoop_data.csv"
-    )  # or json_file='datascoop_data.json'
+        csv_file=args.csv_file,
+        json_file=args.json_file,
+        parquet_file=args.parquet_file,
+    )
 
     # Visualize data
-    visualize_data(data)
+    figures = visualize_data(data, top=args.top)
 
     # Apply machine learning and visualize results
-    cluster_repositories(data)
+    figures += cluster_repositories(
+        data, n_clusters=args.clusters, minibatch=args.minibatch, top=args.top
+    )
+    render_figures(figures, out_dir=args.out_dir, fmt=args.fmt)
@@ -0,0 +1,95 @@
+import json
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import unittest
+
+# Runs gitminer.mine() against scripts/fake-ghe-server.py, offline:
+#   python3 -m unittest discover tests
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKE_SERVER = os.path.join(ROOT_DIR, "scripts", "fake-ghe-server.py")
+sys.path.insert(0, ROOT_DIR)
+
+import gitminer  # noqa: E402
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class FailingSink(object):
+    """
+    Sink whose close raises, like a full disk when the last rows are flushed
+    """
+
+    path = "failing"
+
+    def offset(self):
+        return None
+
+    def write(self, row, languages=None):
+        return
+
+    def close(self):
+        raise OSError("No space left on device")
+
+
+class MineTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        port = free_port()
+        cls.server = subprocess.Popen(
+            [sys.executable, FAKE_SERVER, "--port", str(port), "--orgs", "3"]
+            + ["--repos", "5", "--max-repos", "12"],
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        cls.server.stdout.readline()
+        cls.url = f"http://127.0.0.1:{port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.terminate()
+        cls.server.wait()
+        cls.server.stdout.close()
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+    def mine(self, **options):
+        return list(gitminer.mine(org="org0", url=self.url, token="t", **options))
+
+    def test_db_sink(self):
+        path = os.path.join(self.dir.name, "inventory.db")
+        records = self.mine(sinks=[gitminer.DbSink(path)], workers=4)
+        self.assertTrue(records)
+        with sqlite3.connect(path) as db:
+            names = {name for (name,) in db.execute("SELECT name FROM repos")}
+            finished = db.execute("SELECT finished_at FROM runs").fetchall()
+        self.assertEqual(names, {record["repo_name"] for record in records})
+        self.assertIsNotNone(finished[0][0])
+
+    def test_state_file(self):
+        state_file = os.path.join(self.dir.name, "state.json")
+        records = self.mine(state_file=state_file)
+        with open(state_file) as f:
+            state = json.load(f)
+        self.assertEqual(
+            set(state), {f"org0/{record['repo_name']}" for record in records}
+        )
+        self.assertEqual(self.mine(state_file=state_file), records)
+
+    def test_sink_error_reaches_caller(self):
+        with self.assertRaises(OSError):
+            self.mine(sinks=[FailingSink()])
+
+
+if __name__ == "__main__":
+    unittest.main()